@@ -1,23 +1,28 @@
 """Команды администратора."""
 
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
+from telegram.ext import ContextTypes, CommandHandler, filters
 
-from config import ADMIN_TG_ID
+from config import ADMIN_TG_IDS, REQUIRED_TG_GROUP_ID
 from database import (
     get_all_users,
-    delete_user,
-    toggle_user_active,
+    get_and_delete_user,
+    get_and_toggle_user,
     get_user,
     get_all_booking_history,
     get_user_booking_history,
     get_booking,
-    cancel_booking,
-    add_booking_event
+    get_bookings_for_schedule,
+    cancel_booking_with_event
 )
-from schedule_view import format_all_history, format_user_history
+from rate_limit import TokenBucket
+from schedule_view import iter_all_history, iter_user_history, format_schedule
+from timezone_utils import get_today_date, get_tomorrow_date
 from notifier import send_booking_cancelled_to_user, notify_group_booking_cancelled
 from database import mark_group_notified
 from weekly_stats import (
@@ -27,7 +32,8 @@ from weekly_stats import (
     format_week_range,
     get_week_start,
     get_week_end,
-    ensure_weekly_tables,
+    send_or_update_weekly_pinned,
+    clear_pinned_message_info,
 )
 from alliance_weekly_stats import (
     get_alliance_week_rows,
@@ -36,35 +42,131 @@ from alliance_weekly_stats import (
     format_alliance_week_range,
     get_alliance_week_start,
     get_alliance_week_end,
-    ensure_alliance_weekly_tables,
     clear_pinned_alliance_message,
     send_or_update_alliance_pinned,
 )
 
 logger = logging.getLogger(__name__)
 
+# Лимит длины одного сообщения Telegram (с запасом от 4096)
+TELEGRAM_MESSAGE_LIMIT = 4000
 
-# ══════════════════════════════════════════════════════════════
-# ДЕКОРАТОР ПРОВЕРКИ ПРАВ
-# ══════════════════════════════════════════════════════════════
+# Медали призовых мест в рейтингах
+_MEDALS = ("🥇", "🥈", "🥉")
 
+# Человекочитаемые статусы неактивной брони
+_BOOKING_STATUS_TEXT = {
+    "confirmed":          "уже подтверждена",
+    "cancelled":          "отменена",
+    "cancelled_by_user":  "отменена",
+    "cancelled_by_admin": "отменена администратором",
+    "completed":          "завершена",
+}
 
-def admin_only(func):
-    """Декоратор для проверки прав администратора."""
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.effective_user.id != ADMIN_TG_ID:
-            await update.message.reply_text("❌ Эта команда доступна только администратору.")
-            return
-        return await func(update, context)
-    return wrapper
+
+def _split_for_telegram(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT):
+    """
+    Разбивает длинный текст на части для отправки в Telegram.
+
+    Режет по последнему переводу строки перед лимитом, а не по
+    произвольному символу — HTML-разметка внутри строк остаётся целой
+    (каждая строка в наших сообщениях содержит закрытые теги).
+    """
+    start = 0
+    length = len(text)
+    while length - start > limit:
+        cut = text.rfind("\n", start, start + limit)
+        if cut <= start:
+            # Нет переводов строки — режем жёстко по лимиту
+            cut = start + limit
+        yield text[start:cut]
+        start = cut + 1 if text[cut:cut + 1] == "\n" else cut
+    if start < length:
+        yield text[start:]
+
+
+@lru_cache(maxsize=256)
+def _week_range(ws: str) -> tuple:
+    """(week_end, 'ДД.ММ — ДД.ММ') для недели клуба; мемоизировано по ws."""
+    we = get_week_end(ws)
+    return we, f"{ws[8:10]}.{ws[5:7]} — {we[8:10]}.{we[5:7]}"
+
+
+@lru_cache(maxsize=256)
+def _alliance_week_range(ws: str) -> tuple:
+    """(week_end, 'ДД.ММ — ДД.ММ') для недели альянса; мемоизировано по ws."""
+    we = get_alliance_week_end(ws)
+    return we, f"{ws[8:10]}.{ws[5:7]} — {we[8:10]}.{we[5:7]}"
+
+
+# TTL-кэш недельных выборок: админ часто перезапрашивает одну и ту же
+# текущую неделю подряд — не ходим в БД за идентичным результатом
+_WEEK_CACHE_TTL = 60.0
+_week_cache: dict = {}
+_alliance_week_cache: dict = {}
+
+
+async def _get_week_contributions_cached(week_start: str) -> list:
+    """Выборка вкладов недели с коротким TTL-кэшем."""
+    now = time.monotonic()
+    entry = _week_cache.get(week_start)
+    if entry and now - entry[0] < _WEEK_CACHE_TTL:
+        return entry[1]
+    contributions = await get_week_contributions_from_db(week_start)
+    _week_cache[week_start] = (now, contributions)
+    return contributions
+
+
+async def _get_alliance_rows_cached(week_start: str) -> list:
+    """Выборка вкладов альянса недели с коротким TTL-кэшем."""
+    now = time.monotonic()
+    entry = _alliance_week_cache.get(week_start)
+    if entry and now - entry[0] < _WEEK_CACHE_TTL:
+        return entry[1]
+    rows = await get_alliance_week_rows(week_start)
+    _alliance_week_cache[week_start] = (now, rows)
+    return rows
+
+
+# Лимит Telegram — ~1 сообщение/сек в чат; небольшой burst на короткие ответы
+_send_bucket = TokenBucket(rate=1.0, per=1.0, burst=3)
+
+
+async def _send_part(message, part: str, chat_id: int, **kwargs):
+    """Отправляет одну часть ответа, соблюдая per-chat лимит."""
+    await _send_bucket.acquire(chat_id)
+    await message.reply_text(part, **kwargs)
+
+
+async def _reply_parts(message, text: str, **kwargs):
+    """
+    Отправляет текст, при необходимости разбивая на части.
+
+    Части одного ответа отправляются конкурентно через asyncio.gather —
+    каждая часть это отдельный сетевой round-trip к Telegram, и ждать их
+    последовательно нет смысла. Token bucket удерживает темп в рамках
+    per-chat лимита и защищает от 429.
+    """
+    if len(text) <= TELEGRAM_MESSAGE_LIMIT:
+        await message.reply_text(text, **kwargs)
+        return
+
+    chat_id = message.chat_id
+    await asyncio.gather(*(
+        _send_part(message, part, chat_id, **kwargs)
+        for part in _split_for_telegram(text)
+    ))
 
 
 # ══════════════════════════════════════════════════════════════
 # КОМАНДЫ АДМИНИСТРАТОРА
 # ══════════════════════════════════════════════════════════════
+#
+# Проверка прав вынесена из обработчиков в filters.User при регистрации:
+# PTB отсекает чужие сообщения ещё на уровне диспетчера, до создания
+# корутины обработчика.
 
 
-@admin_only
 async def listusers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Список всех пользователей бота."""
     users = await get_all_users()
@@ -73,28 +175,24 @@ async def listusers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("📋 Пользователей нет.")
         return
 
-    text = f"👥 Пользователи бота ({len(users)}):\n\n"
+    chunks = [f"👥 Пользователи бота ({len(users)}):\n\n"]
 
     for user in users:
         status = "✅" if user.is_active else "⏸"
         verified = "✓" if user.is_verified else "✗"
 
-        text += (
+        chunks.append(
             f"{status} {user.tg_nickname} (@{user.tg_username or 'нет'})\n"
             f"   TG ID: {user.tg_id}\n"
             f"   MB: {user.mangabuff_nick} (ID: {user.mangabuff_id})\n"
             f"   Верифицирован: {verified}\n\n"
         )
 
-    if len(text) > 4000:
-        parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-        for part in parts:
-            await update.message.reply_text(part)
-    else:
-        await update.message.reply_text(text)
+    text = "".join(chunks)
+
+    await _reply_parts(update.message, text)
 
 
-@admin_only
 async def removeuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Удаляет пользователя. Использование: /removeuser <tg_id>"""
     if not context.args or len(context.args) != 1:
@@ -110,23 +208,20 @@ async def removeuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Неверный формат TG ID.")
         return
 
-    user = await get_user(tg_id)
+    user = await get_and_delete_user(tg_id)
     if not user:
         await update.message.reply_text(f"❌ Пользователь с TG ID {tg_id} не найден.")
         return
 
-    await delete_user(tg_id)
-
     await update.message.reply_text(
         f"✅ Пользователь удалён:\n"
         f"TG: {user.tg_nickname} ({tg_id})\n"
         f"MB: {user.mangabuff_nick}"
     )
 
-    logger.info(f"Администратор удалил пользователя {user.tg_nickname} (TG: {tg_id})")
+    logger.info("Администратор удалил пользователя %s (TG: %s)", user.tg_nickname, tg_id)
 
 
-@admin_only
 async def toggleuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Переключает уведомления пользователя. Использование: /toggleuser <tg_id>"""
     if not context.args or len(context.args) != 1:
@@ -142,12 +237,12 @@ async def toggleuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Неверный формат TG ID.")
         return
 
-    user = await get_user(tg_id)
-    if not user:
+    result = await get_and_toggle_user(tg_id)
+    if not result:
         await update.message.reply_text(f"❌ Пользователь с TG ID {tg_id} не найден.")
         return
 
-    new_status = await toggle_user_active(tg_id)
+    user, new_status = result
     status_text = "включены" if new_status else "выключены"
 
     await update.message.reply_text(
@@ -156,10 +251,9 @@ async def toggleuser_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"MB: {user.mangabuff_nick}"
     )
 
-    logger.info(f"Администратор изменил статус уведомлений для {user.tg_nickname}: {status_text}")
+    logger.info("Администратор изменил статус уведомлений для %s: %s", user.tg_nickname, status_text)
 
 
-@admin_only
 async def syncclub_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Принудительный переспарс списка членов клуба."""
     await update.message.reply_text(
@@ -169,13 +263,8 @@ async def syncclub_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Администратор запустил синхронизацию клуба")
 
 
-@admin_only
 async def allbookings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает все активные брони."""
-    from database import get_bookings_for_schedule
-    from timezone_utils import get_today_date, get_tomorrow_date
-    from schedule_view import format_schedule
-
     today = get_today_date()
     tomorrow = get_tomorrow_date()
 
@@ -185,7 +274,6 @@ async def allbookings_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text(text)
 
 
-@admin_only
 async def bookinghistory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Показывает историю броней.
@@ -203,9 +291,14 @@ async def bookinghistory_command(update: Update, context: ContextTypes.DEFAULT_T
 
     arg = context.args[0]
 
+    # Стримим блоки истории в буферы по ~4000 символов,
+    # не материализуя весь текст целиком
+    buf = []
+    size = 0
+
     if arg.lower() == "all":
         bookings = await get_all_booking_history(limit=50)
-        text = format_all_history(bookings)
+        blocks = iter_all_history(bookings)
     else:
         try:
             tg_id = int(arg)
@@ -219,18 +312,27 @@ async def bookinghistory_command(update: Update, context: ContextTypes.DEFAULT_T
             return
 
         bookings = await get_user_booking_history(tg_id, limit=20)
-        text = f"📜 История броней: {user.tg_nickname}\n\n"
-        text += format_user_history(bookings)
+        header = f"📜 История броней: {user.tg_nickname}\n\n"
+        buf.append(header)
+        size = len(header)
+        blocks = iter_user_history(bookings)
 
-    if len(text) > 4000:
-        parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-        for part in parts:
-            await update.message.reply_text(part)
-    else:
-        await update.message.reply_text(text)
+    chat_id = update.effective_chat.id
+
+    for block in blocks:
+        if size and size + len(block) > TELEGRAM_MESSAGE_LIMIT:
+            await _send_bucket.acquire(chat_id)
+            await update.message.reply_text("".join(buf))
+            buf.clear()
+            size = 0
+        buf.append(block)
+        size += len(block)
+
+    if buf:
+        await _send_bucket.acquire(chat_id)
+        await update.message.reply_text("".join(buf))
 
 
-@admin_only
 async def admincancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Принудительная отмена брони.
@@ -255,37 +357,28 @@ async def admincancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     if booking.status not in ["pending", "confirmed"]:
-        status_text = {
-            "confirmed": "уже подтверждена",
-            "cancelled": "отменена",
-            "cancelled_by_user": "отменена",
-            "cancelled_by_admin": "отменена администратором",
-            "completed": "завершена"
-        }.get(booking.status, "неактивна")
+        status_text = _BOOKING_STATUS_TEXT.get(booking.status, "неактивна")
 
         await update.message.reply_text(
-            f"❌ Бронь #{booking_id} уже неактивна (статус: {booking.status})."
+            f"❌ Бронь #{booking_id} {status_text} (статус: {booking.status})."
         )
         return
 
-    await cancel_booking(
+    await cancel_booking_with_event(
         booking_id,
         cancelled_by="admin",
         cancel_reason="Отменена администратором",
+        event_type="cancelled_admin",
         actor_tg_id=update.effective_user.id
     )
 
-    await add_booking_event(
-        booking_id,
-        "cancelled_admin",
-        "admin",
-        actor_tg_id=update.effective_user.id
-    )
-
+    # Три независимых I/O-вызова — выполняем конкурентно
     bot = context.bot
-    await send_booking_cancelled_to_user(bot, booking)
-    await notify_group_booking_cancelled(bot, booking, "admin")
-    await mark_group_notified(booking_id)
+    await asyncio.gather(
+        send_booking_cancelled_to_user(bot, booking),
+        notify_group_booking_cancelled(bot, booking, "admin"),
+        mark_group_notified(booking_id),
+    )
 
     await update.message.reply_text(
         f"✅ Бронь #{booking_id} отменена.\n"
@@ -294,8 +387,8 @@ async def admincancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
     logger.info(
-        f"Администратор отменил бронь #{booking_id} "
-        f"пользователя {booking.tg_nickname}"
+        "Администратор отменил бронь #%s пользователя %s",
+        booking_id, booking.tg_nickname
     )
 
 
@@ -304,7 +397,6 @@ async def admincancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 # ══════════════════════════════════════════════════════════════
 
 
-@admin_only
 async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Показывает статистику вкладов за неделю из БД.
@@ -314,8 +406,6 @@ async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     - /weekstats YYYY-MM-DD — неделя, содержащая эту дату
     - /weekstats list      — список всех доступных недель
     """
-    await ensure_weekly_tables()
-
     arg = context.args[0] if context.args else None
 
     # ── Список доступных недель ──────────────────────────────
@@ -327,13 +417,8 @@ async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         lines = []
         for ws in weeks:
-            we = get_week_end(ws)
-            s = datetime.strptime(ws, "%Y-%m-%d")
-            e = datetime.strptime(we, "%Y-%m-%d")
-            lines.append(
-                f"• {s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}  "
-                f"(запрос: /weekstats {ws})"
-            )
+            _, rng = _week_range(ws)
+            lines.append(f"• {rng}  (запрос: /weekstats {ws})")
 
         text = f"📅 Доступные недели ({len(weeks)}):\n\n" + "\n".join(lines)
         await update.message.reply_text(text)
@@ -356,12 +441,10 @@ async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         week_start = get_week_start()
 
     # ── Получаем данные из БД ────────────────────────────────
-    contributions = await get_week_contributions_from_db(week_start)
+    # Схема гарантирована общим соединением weekly_stats.get_db()
+    contributions = await _get_week_contributions_cached(week_start)
 
-    week_end = get_week_end(week_start)
-    s = datetime.strptime(week_start, "%Y-%m-%d")
-    e = datetime.strptime(week_end, "%Y-%m-%d")
-    range_str = f"{s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}"
+    week_end, range_str = _week_range(week_start)
 
     if not contributions:
         await update.message.reply_text(
@@ -370,15 +453,15 @@ async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Формируем текст с номерами строк
-    total = sum(c["contribution"] for c in contributions)
+    # Формируем текст с номерами строк, попутно считая сумму за один проход
+    total = 0
     lines = [f"📊 <b>Статистика вкладов</b> ({range_str})\n"]
 
-    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
     for i, c in enumerate(contributions, 1):
-        prefix = medals.get(i, f"{i}.")
+        prefix = _MEDALS[i - 1] if i <= 3 else f"{i}."
         url = c.get("profile_url", "")
         name = f'<a href="{url}">{c["nick"]}</a>' if url else c["nick"]
+        total += c["contribution"]
         lines.append(f"{prefix} {name} — <b>{c['contribution']}</b>")
 
     lines.append(f"\n👥 Всего участников: {len(contributions)}")
@@ -387,22 +470,15 @@ async def weekstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = "\n".join(lines)
 
     # Разбиваем на части при необходимости
-    if len(text) > 4000:
-        parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-        for part in parts:
-            await update.message.reply_text(part, parse_mode="HTML",
-                                            disable_web_page_preview=True)
-    else:
-        await update.message.reply_text(text, parse_mode="HTML",
-                                        disable_web_page_preview=True)
+    await _reply_parts(update.message, text, parse_mode="HTML",
+                       disable_web_page_preview=True)
 
     logger.info(
-        f"Администратор запросил статистику за неделю {week_start} "
-        f"({len(contributions)} участников)"
+        "Администратор запросил статистику за неделю %s (%s участников)",
+        week_start, len(contributions)
     )
 
 
-@admin_only
 async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Показывает статистику вкладов клуба в альянс за неделю из БД.
@@ -412,8 +488,6 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
     - /alliancestats YYYY-MM-DD — неделя, содержащая эту дату
     - /alliancestats list      — список всех доступных недель
     """
-    await ensure_alliance_weekly_tables()
-
     arg = context.args[0] if context.args else None
 
     # ── Список доступных недель ──────────────────────────────
@@ -425,13 +499,8 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
 
         lines = []
         for ws in weeks:
-            we = get_alliance_week_end(ws)
-            s = datetime.strptime(ws, "%Y-%m-%d")
-            e = datetime.strptime(we, "%Y-%m-%d")
-            lines.append(
-                f"• {s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}  "
-                f"(запрос: /alliancestats {ws})"
-            )
+            _, rng = _alliance_week_range(ws)
+            lines.append(f"• {rng}  (запрос: /alliancestats {ws})")
 
         text = f"📅 Доступные недели ({len(weeks)}):\n\n" + "\n".join(lines)
         await update.message.reply_text(text)
@@ -440,8 +509,7 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
     # ── Определяем целевую неделю ────────────────────────────
     if arg:
         try:
-            dt = datetime.strptime(arg, "%Y-%m-%d")
-            week_start = get_alliance_week_start(dt)
+            week_start = get_alliance_week_start(date.fromisoformat(arg))
         except ValueError:
             await update.message.reply_text(
                 "❌ Неверный формат даты. Используй YYYY-MM-DD\n"
@@ -453,12 +521,11 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
         week_start = get_alliance_week_start()
 
     # ── Получаем данные из БД ────────────────────────────────
-    rows = await get_alliance_week_rows(week_start)
+    # Схема гарантируется первым get_db() внутри модуля статистики —
+    # отдельный DDL-прогон на каждый вызов команды больше не нужен
+    rows = await _get_alliance_rows_cached(week_start)
 
-    week_end = get_alliance_week_end(week_start)
-    s = datetime.strptime(week_start, "%Y-%m-%d")
-    e = datetime.strptime(week_end, "%Y-%m-%d")
-    range_str = f"{s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}"
+    week_end, range_str = _alliance_week_range(week_start)
 
     if not rows:
         await update.message.reply_text(
@@ -467,18 +534,19 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return
 
-    # Считаем суммарный прирост
-    total_delta  = sum(r["contribution_current"] - r["contribution_baseline"] for r in rows)
-    total_curr   = sum(r["contribution_current"] for r in rows)
-    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    # Суммарный прирост и итог считаются в основном цикле за один проход
+    total_delta = 0
+    total_curr  = 0
 
-    lines = [f"🏰 <b>Вклад клуба в альянс</b> ({range_str})\n"]
-    lines.append(
-        "<code>№   Ник                  Старт → Сейчас  Прирост</code>"
-    )
+    # Размер известен заранее — преаллоцируем список и заполняем по индексу,
+    # без промежуточных list_resize от append
+    n = len(rows)
+    lines = [None] * (n + 5)
+    lines[0] = f"🏰 <b>Вклад клуба в альянс</b> ({range_str})\n"
+    lines[1] = "<code>№   Ник                  Старт → Сейчас  Прирост</code>"
 
     for i, r in enumerate(rows, 1):
-        prefix    = medals.get(i, f"{i}.")
+        prefix    = _MEDALS[i - 1] if i <= 3 else f"{i}."
         url       = r.get("profile_url", "")
         name      = f'<a href="{url}">{r["nick"]}</a>' if url else r["nick"]
         base      = r["contribution_baseline"]
@@ -486,47 +554,41 @@ async def alliancestats_command(update: Update, context: ContextTypes.DEFAULT_TY
         delta     = curr - base
         delta_str = f"+{delta}" if delta >= 0 else str(delta)
 
-        lines.append(
+        total_curr  += curr
+        total_delta += delta
+
+        lines[i + 1] = (
             f"{prefix} {name}\n"
             f"   {base} → <b>{curr}</b>  ({delta_str})"
         )
 
-    lines.append(f"\n👥 Участников: {len(rows)}")
-    lines.append(f"📈 Прирост за неделю: <b>+{total_delta}</b>")
-    lines.append(f"🔢 Итого вкладов сейчас: <b>{total_curr}</b>")
+    lines[n + 2] = f"\n👥 Участников: {n}"
+    lines[n + 3] = f"📈 Прирост за неделю: <b>+{total_delta}</b>"
+    lines[n + 4] = f"🔢 Итого вкладов сейчас: <b>{total_curr}</b>"
 
     text = "\n".join(lines)
 
-    if len(text) > 4000:
-        parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-        for part in parts:
-            await update.message.reply_text(
-                part, parse_mode="HTML", disable_web_page_preview=True
-            )
-    else:
-        await update.message.reply_text(
-            text, parse_mode="HTML", disable_web_page_preview=True
-        )
+    await _reply_parts(update.message, text, parse_mode="HTML",
+                       disable_web_page_preview=True)
 
     logger.info(
-        f"Администратор запросил вклады в альянс за {week_start} "
-        f"({len(rows)} участников, прирост +{total_delta})"
+        "Администратор запросил вклады в альянс за %s (%s участников, прирост +%s)",
+        week_start, len(rows), total_delta
     )
 
 
-@admin_only
 async def refreshalliance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Принудительно пересоздаёт закреплённое сообщение вкладов клуба в альянс.
     Полезно если сообщение было удалено или бот потерял message_id.
     """
-    from config import REQUIRED_TG_GROUP_ID
-
     await update.message.reply_text("⏳ Обновляю сообщение вкладов в альянс...")
 
     await clear_pinned_alliance_message(REQUIRED_TG_GROUP_ID)
 
     week_start = get_alliance_week_start()
+    # Принудительное обновление — кэш недели сбрасываем
+    _alliance_week_cache.pop(week_start, None)
     rows = await get_alliance_week_rows(week_start)
 
     if not rows:
@@ -540,26 +602,19 @@ async def refreshalliance_command(update: Update, context: ContextTypes.DEFAULT_
     await update.message.reply_text("✅ Закреплённое сообщение альянса обновлено.")
 
 
-@admin_only
 async def refreshweekly_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Принудительно обновляет закреплённое сообщение недельной статистики.
     Полезно если бот потерял message_id или сообщение было удалено.
     """
-    from weekly_stats import (
-        get_week_contributions_from_db,
-        send_or_update_weekly_pinned,
-        clear_pinned_message_info,
-        get_week_start,
-    )
-    from config import REQUIRED_TG_GROUP_ID
-
     await update.message.reply_text("⏳ Обновляю закреплённое сообщение...")
 
     # Сбрасываем сохранённый message_id чтобы отправить новое сообщение
     await clear_pinned_message_info(REQUIRED_TG_GROUP_ID)
 
     week_start = get_week_start()
+    # Принудительное обновление — кэш недели сбрасываем
+    _week_cache.pop(week_start, None)
     contributions = await get_week_contributions_from_db(week_start)
 
     if not contributions:
@@ -578,18 +633,29 @@ async def refreshweekly_command(update: Update, context: ContextTypes.DEFAULT_TY
 # ══════════════════════════════════════════════════════════════
 
 
+# Таблица команда → обработчик: регистрация одним циклом
+_ADMIN_COMMANDS = (
+    ("listusers",       listusers_command),
+    ("removeuser",      removeuser_command),
+    ("toggleuser",      toggleuser_command),
+    ("syncclub",        syncclub_command),
+    ("allbookings",     allbookings_command),
+    ("bookinghistory",  bookinghistory_command),
+    ("admincancel",     admincancel_command),
+    ("weekstats",       weekstats_command),
+    ("refreshweekly",   refreshweekly_command),
+    ("alliancestats",   alliancestats_command),
+    ("refreshalliance", refreshalliance_command),
+)
+
+
 def register_admin_handlers(application):
     """Регистрирует команды администратора."""
-    application.add_handler(CommandHandler("listusers", listusers_command))
-    application.add_handler(CommandHandler("removeuser", removeuser_command))
-    application.add_handler(CommandHandler("toggleuser", toggleuser_command))
-    application.add_handler(CommandHandler("syncclub", syncclub_command))
-    application.add_handler(CommandHandler("allbookings", allbookings_command))
-    application.add_handler(CommandHandler("bookinghistory", bookinghistory_command))
-    application.add_handler(CommandHandler("admincancel", admincancel_command))
-    application.add_handler(CommandHandler("weekstats", weekstats_command))
-    application.add_handler(CommandHandler("refreshweekly", refreshweekly_command))
-    application.add_handler(CommandHandler("alliancestats", alliancestats_command))
-    application.add_handler(CommandHandler("refreshalliance", refreshalliance_command))
+    # Фильтр отсекает не-админов на уровне диспетчера PTB —
+    # без создания корутины обработчика; чужие команды молча игнорируются
+    admin_filter = filters.User(user_id=ADMIN_TG_IDS)
+
+    for name, fn in _ADMIN_COMMANDS:
+        application.add_handler(CommandHandler(name, fn, filters=admin_filter))
 
     logger.info("✅ Команды администратора зарегистрированы")
\ No newline at end of file
@@ -8,26 +8,67 @@
 """
 
 import asyncio
+import functools
+import hashlib
 import logging
+import random
+import re
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
 
-from config import BASE_URL, ALLIANCE_URL, ALLIANCE_CHECK_INTERVAL
+from config import BASE_URL, ALLIANCE_URL, ALLIANCE_CHECK_INTERVAL, USER_AGENT
 from timezone_utils import ts_for_db, now_msk
 from alliance_weekly_stats import (
     CLUB_PAGE_ATTR,
     parse_alliance_club_contributions,
     compute_alliance_hash,
     get_alliance_week_start,
-    get_alliance_week_rows,
     upsert_alliance_contributions,
+    upsert_alliance_contributions_returning,
     send_or_update_alliance_pinned,
 )
 
 logger = logging.getLogger(__name__)
 
+# Быстрое извлечение slug регэкспами по сырой строке —
+# один линейный проход вместо построения дерева bs4
+_SLUG_HREF_RE = re.compile(
+    rb'class="card-show__placeholder"[^>]*href="/manga/([^"]+)"'
+)
+_SLUG_BG_RE = re.compile(
+    rb"card-show__header[^>]*background-image:\s*url\('[^']*/posters/([^'.]+)\.jpg'"
+)
+
+
+# Прекомпилированные XPath для страницы деталей манги: разметка
+# известна заранее, выражения компилируются один раз при импорте
+_TITLE_XPATH = etree.XPath(
+    "(//h1[contains(@class,'manga-mobile__name')]"
+    " | //h1[contains(@class,'manga__name')])[1]/text()"
+)
+_IMG_XPATH = etree.XPath(
+    "(//img[contains(@class,'manga-mobile__image')]"
+    " | //div[contains(@class,'manga__img')]//img)[1]/@src"
+)
+
+
+@functools.lru_cache(maxsize=4)
+def _week_start_cached(minute_epoch: int) -> str:
+    """
+    Начало недели альянса, мемоизированное по минутной отметке.
+
+    Само значение меняется раз в неделю, так что datetime-арифметика
+    с таймзоной выполняется не чаще одного раза в минуту вместо
+    каждого тика.
+    """
+    return get_alliance_week_start()
+
 
 # ══════════════════════════════════════════════════════════════
 # ПАРСЕР АЛЬЯНСА
@@ -39,67 +80,125 @@ class AllianceParser:
 
     MAX_RETRIES = 3
     RETRY_DELAY = 5
+    DETAILS_CACHE_SIZE = 64
 
     def __init__(self, session: requests.Session):
         self.session = session
 
+        # Пул соединений с keep-alive: TLS-рукопожатие делается один раз,
+        # дальше каждый опрос — один HTTP round-trip по живому соединению
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2, pool_maxsize=20
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.setdefault("User-Agent", USER_AGENT)
+        session.headers["Connection"] = "keep-alive"
+
+        # Валидаторы условного GET: при 304 сервер не шлёт тело,
+        # и тик обходится без скачивания и парсинга страницы
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+
+        # LRU slug → детали манги: при «дребезге» тайтла туда-обратно
+        # повторный детальный HTTP-запрос не выполняется
+        self._details_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    async def _retry_sleep(self, attempt: int):
+        """Пауза перед следующей попыткой: экспоненциальный backoff."""
+        if attempt < self.MAX_RETRIES - 1:
+            await asyncio.sleep(self.RETRY_DELAY * (2 ** attempt))
+
     # ── Получение HTML страницы ──────────────────────────────
 
-    def fetch_page(self) -> Optional[str]:
+    async def fetch_page(self) -> Optional[bytes]:
         """
         Загружает HTML страницы альянса.
 
+        Корутина: сам блокирующий запрос уходит в thread pool, а паузы
+        между ретраями — неблокирующий asyncio.sleep, event loop
+        свободен на всё время ожидания.
+
+        Возвращает сырые байты ответа: lxml и регэкспы работают с ними
+        напрямую, без Unicode-декодирования и chardet-определения
+        кодировки на каждый тик.
+
         Returns:
-            HTML-строка или None при ошибке.
+            HTML-байты, b"" если страница не менялась (HTTP 304)
+            или None при ошибке.
         """
+        loop = asyncio.get_event_loop()
+
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
         for attempt in range(self.MAX_RETRIES):
             try:
-                response = self.session.get(ALLIANCE_URL, timeout=15)
+                response = await loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        self.session.get, ALLIANCE_URL,
+                        timeout=15, headers=headers,
+                    ),
+                )
+
+                if response.status_code == 304:
+                    return b""
 
                 if response.status_code == 500:
                     logger.warning(
-                        f"[Alliance] HTTP 500 (попытка {attempt + 1}/{self.MAX_RETRIES})"
+                        "[Alliance] HTTP 500 (попытка %d/%d)",
+                        attempt + 1, self.MAX_RETRIES,
                     )
-                    if attempt < self.MAX_RETRIES - 1:
-                        import time; time.sleep(self.RETRY_DELAY)
-                    continue
-
-                if response.status_code != 200:
+                elif response.status_code != 200:
                     logger.warning(
-                        f"[Alliance] HTTP {response.status_code} "
-                        f"(попытка {attempt + 1}/{self.MAX_RETRIES})"
+                        "[Alliance] HTTP %d (попытка %d/%d)",
+                        response.status_code, attempt + 1, self.MAX_RETRIES,
                     )
-                    if attempt < self.MAX_RETRIES - 1:
-                        import time; time.sleep(self.RETRY_DELAY)
-                    continue
-
-                return response.text
+                else:
+                    self._etag = response.headers.get("ETag")
+                    self._last_modified = response.headers.get("Last-Modified")
+                    return response.content
 
             except requests.exceptions.Timeout:
                 logger.warning(
-                    f"[Alliance] Таймаут (попытка {attempt + 1}/{self.MAX_RETRIES})"
+                    "[Alliance] Таймаут (попытка %d/%d)",
+                    attempt + 1, self.MAX_RETRIES,
                 )
-                if attempt < self.MAX_RETRIES - 1:
-                    import time; time.sleep(self.RETRY_DELAY)
             except requests.exceptions.ConnectionError:
                 logger.warning(
-                    f"[Alliance] Ошибка соединения (попытка {attempt + 1}/{self.MAX_RETRIES})"
+                    "[Alliance] Ошибка соединения (попытка %d/%d)",
+                    attempt + 1, self.MAX_RETRIES,
                 )
-                if attempt < self.MAX_RETRIES - 1:
-                    import time; time.sleep(self.RETRY_DELAY)
             except Exception as e:
                 logger.error(f"[Alliance] Ошибка загрузки: {e}", exc_info=True)
-                if attempt < self.MAX_RETRIES - 1:
-                    import time; time.sleep(self.RETRY_DELAY)
+
+            await self._retry_sleep(attempt)
 
         return None
 
     # ── Парсинг slug текущей манги ────────────────────────────
 
-    def get_current_manga_slug(self, html: str) -> Optional[str]:
-        """Извлекает slug текущей манги из уже загруженного HTML."""
+    def get_current_manga_slug(
+        self, html: bytes, soup: Optional[BeautifulSoup] = None
+    ) -> Optional[str]:
+        """
+        Извлекает slug текущей манги из уже загруженного HTML.
+
+        Быстрый путь — прекомпилированные регэкспы; BeautifulSoup
+        остаётся запасным вариантом на случай смены разметки
+        (если дерево уже построено вызывающим, оно переиспользуется).
+        """
+        m = _SLUG_HREF_RE.search(html) or _SLUG_BG_RE.search(html)
+        if m:
+            return m.group(1).decode()
+
         try:
-            soup = BeautifulSoup(html, "html.parser")
+            if soup is None:
+                soup = BeautifulSoup(html, "lxml")
 
             # Вариант 1: ссылка card-show__placeholder
             manga_link = soup.find("a", class_="card-show__placeholder")
@@ -122,51 +221,46 @@ class AllianceParser:
             return None
 
         except Exception as e:
-            logger.error(f"[Alliance] Ошибка парсинга slug: {e}")
+            logger.error("[Alliance] Ошибка парсинга slug: %s", e)
             return None
 
     # ── Детальные данные о манге ──────────────────────────────
 
-    def get_manga_details(self, manga_slug: str) -> Optional[Dict[str, Any]]:
-        """Получает детальную информацию о манге по slug."""
+    async def get_manga_details(self, manga_slug: str) -> Optional[Dict[str, Any]]:
+        """Получает детальную информацию о манге по slug (с LRU-кэшем)."""
+        cached = self._details_cache.get(manga_slug)
+        if cached is not None:
+            self._details_cache.move_to_end(manga_slug)
+            return cached
+
+        loop = asyncio.get_event_loop()
+        url = f"{BASE_URL}/manga/{manga_slug}"
+
         for attempt in range(self.MAX_RETRIES):
             try:
-                url = f"{BASE_URL}/manga/{manga_slug}"
-                response = self.session.get(url, timeout=15)
+                response = await loop.run_in_executor(
+                    None,
+                    functools.partial(self.session.get, url, timeout=15),
+                )
 
-                if response.status_code not in (200,):
-                    if attempt < self.MAX_RETRIES - 1:
-                        import time; time.sleep(self.RETRY_DELAY)
+                if response.status_code != 200:
+                    await self._retry_sleep(attempt)
                     continue
 
-                soup = BeautifulSoup(response.text, "html.parser")
+                doc = lxml_html.fromstring(response.content)
 
                 # Название
-                title = None
-                for cls in ("manga-mobile__name", "manga__name"):
-                    elem = soup.find("h1", class_=cls)
-                    if elem:
-                        title = elem.text.strip()
-                        break
-                if not title:
-                    title = manga_slug
+                found = _TITLE_XPATH(doc)
+                title = found[0].strip() if found else manga_slug
 
                 # Изображение
-                img_src = None
-                img_elem = soup.find("img", class_="manga-mobile__image")
-                if img_elem:
-                    img_src = img_elem.get("src")
-                if not img_src:
-                    wrapper = soup.find("div", class_="manga__img")
-                    if wrapper:
-                        img = wrapper.find("img")
-                        if img:
-                            img_src = img.get("src")
+                found = _IMG_XPATH(doc)
+                img_src = found[0] if found else None
 
                 if img_src and img_src.startswith("/"):
                     img_src = f"{BASE_URL}{img_src}"
 
-                return {
+                manga_info = {
                     "slug":          manga_slug,
                     "title":         title,
                     "image":         img_src,
@@ -174,13 +268,18 @@ class AllianceParser:
                     "discovered_at": ts_for_db(now_msk()),
                 }
 
+                self._details_cache[manga_slug] = manga_info
+                if len(self._details_cache) > self.DETAILS_CACHE_SIZE:
+                    self._details_cache.popitem(last=False)
+
+                return manga_info
+
             except Exception as e:
                 logger.error(
                     f"[Alliance] Ошибка деталей манги {manga_slug}: {e}",
                     exc_info=True
                 )
-                if attempt < self.MAX_RETRIES - 1:
-                    import time; time.sleep(self.RETRY_DELAY)
+                await self._retry_sleep(attempt)
 
         return None
 
@@ -190,6 +289,21 @@ class AllianceParser:
 # ══════════════════════════════════════════════════════════════
 
 
+def _parse_tick(parser: "AllianceParser", html: bytes):
+    """
+    CPU-часть тика одной пачкой: slug, вклады и хэш.
+
+    Выносится в thread pool целиком — один переход между потоками
+    вместо нескольких, event loop в это время обслуживает бота.
+    Slug почти всегда берётся регэкспом без дерева; вклады парсятся
+    по C-узлам lxml.
+    """
+    new_slug = parser.get_current_manga_slug(html)
+    contributions = parse_alliance_club_contributions(html)
+    current_hash = compute_alliance_hash(contributions) if contributions else None
+    return new_slug, contributions, current_hash
+
+
 async def alliance_monitor_loop(session: requests.Session, bot):
     """
     Фоновый цикл мониторинга альянса.
@@ -209,12 +323,10 @@ async def alliance_monitor_loop(session: requests.Session, bot):
     parser = AllianceParser(session)
     logger.info("🔄 Запущен мониторинг альянса (манга + вклады клуба)")
 
-    loop = asyncio.get_event_loop()
-
     # ── Стартовое состояние ──────────────────────────────────
 
     # Загружаем страницу один раз при старте
-    start_html = await loop.run_in_executor(None, parser.fetch_page)
+    start_html = await parser.fetch_page()
 
     current_slug: Optional[str] = None
     if start_html:
@@ -224,132 +336,163 @@ async def alliance_monitor_loop(session: requests.Session, bot):
     saved = await get_current_alliance_manga()
 
     if saved is None and current_slug and start_html:
-        manga_info = await loop.run_in_executor(
-            None, parser.get_manga_details, current_slug
-        )
+        manga_info = await parser.get_manga_details(current_slug)
         if manga_info:
             await save_alliance_manga(manga_info)
             await notify_alliance_manga_changed(bot, manga_info, is_startup=True)
-            logger.info(f"🚀 Стартовый тайтл альянса: {manga_info['title']}")
+            logger.info("🚀 Стартовый тайтл альянса: %s", manga_info["title"])
     elif saved:
         current_slug = saved["slug"]
-        logger.info(f"🔖 Тайтл альянса из БД: {saved['title']}")
+        logger.info("🔖 Тайтл альянса из БД: %s", saved["title"])
 
     # ── Состояние мониторинга вкладов ────────────────────────
 
-    last_club_hash:  Optional[str] = None
+    last_club_hash:  Optional[int] = None
     last_week_start: str           = get_alliance_week_start()
     is_initialized:  bool          = False   # флаг первого успешного снимка
 
+    # Хэш сырого HTML: если тело страницы байт-в-байт прежнее,
+    # тик пропускает оба парсера (blake2b на ~100 КБ — микросекунды)
+    last_raw_hash: Optional[bytes] = None
+    if start_html:
+        last_raw_hash = hashlib.blake2b(start_html, digest_size=16).digest()
+
     # Стартовая инициализация вкладов из первой загрузки
     if start_html:
         contributions = parse_alliance_club_contributions(start_html)
         if contributions:
-            await upsert_alliance_contributions(
+            rows = await upsert_alliance_contributions_returning(
                 last_week_start, contributions, is_new_week=True
             )
-            rows = await get_alliance_week_rows(last_week_start)
             await send_or_update_alliance_pinned(bot, rows, last_week_start)
             last_club_hash = compute_alliance_hash(contributions)
             is_initialized = True
             logger.info(
-                f"🚀 Старт мониторинга вкладов клуба: "
-                f"{len(contributions)} участников, неделя {last_week_start}"
+                "🚀 Старт мониторинга вкладов клуба: "
+                "%d участников, неделя %s",
+                len(contributions), last_week_start,
             )
 
     # ── Основной цикл ─────────────────────────────────────────
 
     check_count = 0
+    stable_ticks = 0   # тиков подряд без изменений — для адаптивного интервала
 
     while True:
         try:
-            await asyncio.sleep(ALLIANCE_CHECK_INTERVAL)
+            # Без изменений интервал удваивается каждые 10 тиков (до x16),
+            # после изменения возвращается к базовому; джиттер размазывает
+            # нагрузку, чтобы опросы не били в сервер синхронно
+            interval = min(
+                ALLIANCE_CHECK_INTERVAL * (2 ** min(stable_ticks // 10, 4)),
+                ALLIANCE_CHECK_INTERVAL * 16,
+            )
+            await asyncio.sleep(interval + random.random())
             check_count += 1
+            stable_ticks += 1
 
-            html = await loop.run_in_executor(None, parser.fetch_page)
-            if not html:
+            html = await parser.fetch_page()
+            if html is None:
                 if check_count % 60 == 0:
                     logger.warning("[Alliance] Не удалось загрузить страницу")
                 continue
+            if not html:
+                # HTTP 304 — страница не менялась, парсить нечего
+                continue
+
+            raw_hash = hashlib.blake2b(html, digest_size=16).digest()
+            if raw_hash == last_raw_hash:
+                # Тело идентично прошлому тику — парсить нечего
+                continue
+            last_raw_hash = raw_hash
 
-            current_week_start = get_alliance_week_start()
+            current_week_start = _week_start_cached(int(time.time()) // 60)
+
+            # Парсинг и хэширование — CPU-работа, уходит в thread pool
+            new_slug, contributions, current_hash = await asyncio.to_thread(
+                _parse_tick, parser, html
+            )
 
             # ══════════════════════════════════════════════════
             # СМЕНА МАНГИ
             # ══════════════════════════════════════════════════
 
-            new_slug = parser.get_current_manga_slug(html)
+            details_task = None
             if new_slug and new_slug != current_slug:
                 logger.info(
-                    f"[Alliance] Смена тайтла: {current_slug} → {new_slug}"
+                    "[Alliance] Смена тайтла: %s → %s", current_slug, new_slug
                 )
-                manga_info = await loop.run_in_executor(
-                    None, parser.get_manga_details, new_slug
+                # Детали тайтла качаются параллельно с обработкой вкладов;
+                # задача дожидается ниже, на выходе из тика
+                details_task = asyncio.create_task(
+                    parser.get_manga_details(new_slug)
                 )
-                if manga_info:
-                    await save_alliance_manga(manga_info)
-                    await notify_alliance_manga_changed(bot, manga_info, is_startup=False)
-                    current_slug = new_slug
-                    logger.info(
-                        f"✅ Уведомление об альянсе отправлено: {manga_info['title']}"
-                    )
-                else:
-                    current_slug = new_slug
+                current_slug = new_slug
 
             # ══════════════════════════════════════════════════
             # МОНИТОРИНГ ВКЛАДОВ КЛУБА
             # ══════════════════════════════════════════════════
 
-            contributions = parse_alliance_club_contributions(html)
             if not contributions:
                 if check_count % 60 == 0:
                     logger.debug("[Alliance] Вклады клуба не найдены")
-                continue
+            else:
+                # Смена недели
+                if current_week_start != last_week_start:
+                    logger.info(
+                        "[Alliance] Новая неделя: %s → %s",
+                        last_week_start, current_week_start,
+                    )
+                    # Сохраняем текущие значения как baseline новой недели
+                    await upsert_alliance_contributions(
+                        current_week_start, contributions, is_new_week=True
+                    )
+                    last_week_start = current_week_start
+                    last_club_hash  = None   # Сбрасываем для гарантированного обновления
+
+                # Данные изменились
+                if current_hash != last_club_hash:
+                    is_new = not is_initialized or current_week_start != last_week_start
+                    rows = await upsert_alliance_contributions_returning(
+                        current_week_start,
+                        contributions,
+                        is_new_week=is_new,
+                    )
+                    await send_or_update_alliance_pinned(bot, rows, current_week_start)
+                    last_club_hash = current_hash
+                    is_initialized = True
+                    stable_ticks   = 0   # снова частый опрос после изменения
+
+                    # Топ-прироста для лога: дельты считаем по одному разу
+                    deltas = [
+                        (r["contribution_current"] - r["contribution_baseline"], r)
+                        for r in rows
+                    ]
+                    if deltas:
+                        top_delta, top = max(deltas, key=lambda t: t[0])
+                        logger.info(
+                            "[Alliance] Вклады обновлены. "
+                            "Лидер прироста: %s (+%d)",
+                            top["nick"], top_delta,
+                        )
+                elif check_count % 60 == 0:
+                    logger.debug(
+                        "[Alliance] Вклады без изменений (проверка #%d)", check_count
+                    )
 
-            current_hash = compute_alliance_hash(contributions)
+            # ══════════════════════════════════════════════════
+            # ЗАВЕРШЕНИЕ СМЕНЫ МАНГИ
+            # ══════════════════════════════════════════════════
 
-            # Смена недели
-            if current_week_start != last_week_start:
-                logger.info(
-                    f"[Alliance] Новая неделя: "
-                    f"{last_week_start} → {current_week_start}"
-                )
-                # Сохраняем текущие значения как baseline новой недели
-                await upsert_alliance_contributions(
-                    current_week_start, contributions, is_new_week=True
-                )
-                last_week_start = current_week_start
-                last_club_hash  = None   # Сбрасываем для гарантированного обновления
-
-            # Данные изменились
-            if current_hash != last_club_hash:
-                is_new = not is_initialized or current_week_start != last_week_start
-                await upsert_alliance_contributions(
-                    current_week_start,
-                    contributions,
-                    is_new_week=is_new,
-                )
-                rows = await get_alliance_week_rows(current_week_start)
-                await send_or_update_alliance_pinned(bot, rows, current_week_start)
-                last_club_hash = current_hash
-                is_initialized = True
-
-                # Находим топ-прироста для лога
-                top = max(
-                    rows,
-                    key=lambda r: r["contribution_current"] - r["contribution_baseline"],
-                    default=None,
-                )
-                if top:
-                    delta = top["contribution_current"] - top["contribution_baseline"]
+            if details_task is not None:
+                manga_info = await details_task
+                if manga_info:
+                    await save_alliance_manga(manga_info)
+                    await notify_alliance_manga_changed(bot, manga_info, is_startup=False)
                     logger.info(
-                        f"[Alliance] Вклады обновлены. "
-                        f"Лидер прироста: {top['nick']} (+{delta})"
+                        "✅ Уведомление об альянсе отправлено: %s",
+                        manga_info["title"],
                     )
-            elif check_count % 60 == 0:
-                logger.debug(
-                    f"[Alliance] Вклады без изменений (проверка #{check_count})"
-                )
 
         except asyncio.CancelledError:
             logger.info("⏹ Мониторинг альянса остановлен")
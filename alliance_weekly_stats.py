@@ -2,13 +2,18 @@
 Модуль мониторинга вкладов клуба в альянс.
 """
 
+import asyncio
 import hashlib
 import logging
-from datetime import datetime, timedelta
+import re
+import struct
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import List, Dict, Optional
 
 import aiosqlite
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
 from telegram import Bot
 from telegram.error import TelegramError
 
@@ -20,66 +25,139 @@ DB_PATH = "bot_data.db"
 
 CLUB_PAGE_ATTR = "club64"
 
+# Скомпилирован один раз — в цикле парсинга поиск id идёт без
+# обращения к внутреннему кэшу модуля re на каждую ссылку
+_USER_ID_RE = re.compile(r"/users/(\d+)")
+
+# Прекомпилированные XPath: блок клуба фиксированной разметки
+# обходится по C-узлам lxml, без Python-обёрток bs4
+_CLASS_XP = 'contains(concat(" ", normalize-space(@class), " "), " %s ")'
+_CLUB_DIV_XPATH = etree.XPath("//div[@data-page = $page]")
+_DATA_PAGE_XPATH = etree.XPath("//div[@data-page]/@data-page")
+_TOP_ITEM_XPATH = etree.XPath(".//div[%s]" % (_CLASS_XP % "club-boost__top-item"))
+_TOP_NAME_XPATH = etree.XPath("(.//a[%s])[1]" % (_CLASS_XP % "club-boost__top-name"))
+_TOP_CONTRIB_XPATH = etree.XPath(
+    "(.//*[%s])[1]" % (_CLASS_XP % "club-boost__top-contribution")
+)
+
 
 # ══════════════════════════════════════════════════════════════
 # УТИЛИТЫ НЕДЕЛИ
 # ══════════════════════════════════════════════════════════════
 
 
-def get_alliance_week_start(dt: datetime = None) -> str:
+def get_alliance_week_start(dt=None) -> str:
+    # Работаем с date напрямую: datetime нужен только чтобы узнать
+    # сегодняшний день, дальше — чистая date-арифметика
     if dt is None:
-        dt = now_msk()
-    monday = dt.date() - timedelta(days=dt.weekday())
-    return monday.isoformat()
+        d = now_msk().date()
+    elif isinstance(dt, datetime):
+        d = dt.date()
+    else:
+        d = dt
+    return (d - timedelta(days=d.weekday())).isoformat()
 
 
 def get_alliance_week_end(week_start: str) -> str:
-    monday = datetime.strptime(week_start, "%Y-%m-%d").date()
+    # fromisoformat реализован на C и на порядок быстрее strptime
+    monday = date.fromisoformat(week_start)
     return (monday + timedelta(days=6)).isoformat()
 
 
+@lru_cache(maxsize=64)
 def format_alliance_week_range(week_start: str) -> str:
-    week_end = get_alliance_week_end(week_start)
-    s = datetime.strptime(week_start, "%Y-%m-%d")
-    e = datetime.strptime(week_end, "%Y-%m-%d")
+    # Диапазон недели меняется раз в неделю, а рендерится при каждом
+    # обновлении закрепа — результат мемоизируется
+    s = date.fromisoformat(week_start)
+    e = s + timedelta(days=6)
     return f"{s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}"
 
 
 # ══════════════════════════════════════════════════════════════
-# ИНИЦИАЛИЗАЦИЯ ТАБЛИЦ
+# СОЕДИНЕНИЕ И ИНИЦИАЛИЗАЦИЯ ТАБЛИЦ
 # ══════════════════════════════════════════════════════════════
 
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Долгоживущее соединение модуля.
+
+    Раньше каждый хелпер открывал новое aiosqlite.connect и заново
+    прогонял CREATE TABLE IF NOT EXISTS; теперь рукопожатие,
+    PRAGMA-настройки и схема выполняются один раз на процесс.
+    """
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(DB_PATH)
+                db.row_factory = aiosqlite.Row
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("PRAGMA temp_store=MEMORY")
+                await db.execute("PRAGMA mmap_size=268435456")
+                await _create_tables(db)
+                _db = db
+    return _db
+
 
 async def ensure_alliance_weekly_tables():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS alliance_club_contributions (
-                id                      INTEGER PRIMARY KEY AUTOINCREMENT,
-                week_start              TEXT NOT NULL,
-                mangabuff_id            INTEGER NOT NULL,
-                nick                    TEXT NOT NULL,
-                profile_url             TEXT,
-                contribution_baseline   INTEGER NOT NULL DEFAULT 0,
-                contribution_current    INTEGER NOT NULL DEFAULT 0,
-                updated_at              TEXT NOT NULL,
-                UNIQUE(week_start, mangabuff_id)
-            )
-        """)
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_alliance_club_week
-            ON alliance_club_contributions(week_start, contribution_current DESC)
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS pinned_alliance_weekly_message (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id     INTEGER NOT NULL UNIQUE,
-                thread_id   INTEGER,
-                message_id  INTEGER NOT NULL,
-                week_start  TEXT NOT NULL,
-                updated_at  TEXT NOT NULL
-            )
-        """)
-        await db.commit()
+    """Схема создаётся при первом get_db(); оставлено для совместимости."""
+    await get_db()
+
+
+async def _create_tables(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS alliance_club_contributions (
+            id                      INTEGER PRIMARY KEY AUTOINCREMENT,
+            week_start              TEXT NOT NULL,
+            mangabuff_id            INTEGER NOT NULL,
+            nick                    TEXT NOT NULL,
+            profile_url             TEXT,
+            contribution_baseline   INTEGER NOT NULL DEFAULT 0,
+            contribution_current    INTEGER NOT NULL DEFAULT 0,
+            updated_at              TEXT NOT NULL,
+            UNIQUE(week_start, mangabuff_id)
+        )
+    """)
+    # Покрывающий индекс: SELECT недели читается index-only сканом,
+    # без обращений к самой таблице. Старый индекс им полностью покрыт.
+    await db.execute("DROP INDEX IF EXISTS idx_alliance_club_week")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_alliance_club_week_cover
+        ON alliance_club_contributions(
+            week_start, contribution_current DESC,
+            nick, profile_url, contribution_baseline
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS alliance_weekly_meta (
+            key    TEXT PRIMARY KEY,
+            value  TEXT NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS pinned_alliance_weekly_message (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id     INTEGER NOT NULL UNIQUE,
+            thread_id   INTEGER,
+            message_id  INTEGER NOT NULL,
+            week_start  TEXT NOT NULL,
+            updated_at  TEXT NOT NULL,
+            content_hash TEXT
+        )
+    """)
+    # Миграция для БД, созданных до появления content_hash
+    try:
+        await db.execute(
+            "ALTER TABLE pinned_alliance_weekly_message ADD COLUMN content_hash TEXT"
+        )
+    except aiosqlite.OperationalError:
+        pass
+    await db.commit()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -87,35 +165,57 @@ async def ensure_alliance_weekly_tables():
 # ══════════════════════════════════════════════════════════════
 
 
-def parse_alliance_club_contributions(html: str, club_page: str = CLUB_PAGE_ATTR) -> List[Dict]:
-    soup = BeautifulSoup(html, "html.parser")
-    club_div = soup.find("div", attrs={"data-page": club_page})
+def parse_alliance_club_contributions(html, club_page: str = CLUB_PAGE_ATTR) -> List[Dict]:
+    """
+    Парсит вклады клуба из HTML страницы альянса.
 
-    if not club_div:
+    Принимает сырой HTML (str/bytes) либо готовый lxml-элемент —
+    обход идёт напрямую по C-узлам lxml через прекомпилированные
+    XPath, без bs4-обёрток.
+    """
+    if isinstance(html, (str, bytes)):
+        # Дешёвая проверка подстроки до построения дерева: на странице
+        # без блока клуба (сброс альянса, ошибка сайта) парсер не нужен
+        needle = f'data-page="{club_page}"'
+        if isinstance(html, bytes):
+            needle = needle.encode()
+        if needle not in html:
+            logger.warning(
+                "Блок data-page='%s' отсутствует в HTML — парсинг пропущен",
+                club_page,
+            )
+            return []
+        doc = lxml_html.fromstring(html)
+    else:
+        doc = html
+
+    club_divs = _CLUB_DIV_XPATH(doc, page=club_page)
+    if not club_divs:
         logger.warning(
-            f"Блок data-page='{club_page}' не найден. "
-            f"Доступные табы: "
-            + str([d.get("data-page") for d in soup.find_all(attrs={"data-page": True})])
+            "Блок data-page='%s' не найден. Доступные табы: %s",
+            club_page, list(_DATA_PAGE_XPATH(doc)),
         )
         return []
 
     results = []
-    import re
-    for item in club_div.select(".club-boost__top-item"):
-        name_link = item.select_one("a.club-boost__top-name")
-        if not name_link:
+    for item in _TOP_ITEM_XPATH(club_divs[0]):
+        name_links = _TOP_NAME_XPATH(item)
+        if not name_links:
             continue
+        name_link = name_links[0]
 
-        nick = name_link.text.strip()
-        href = name_link.get("href", "")
+        nick = name_link.text_content().strip()
+        href = name_link.get("href") or ""
 
-        match = re.search(r"/users/(\d+)", href)
+        match = _USER_ID_RE.search(href)
         mangabuff_id = int(match.group(1)) if match else 0
         profile_url = (f"{BASE_URL}{href}" if href.startswith("/") else href)
 
-        contrib_el = item.select_one(".club-boost__top-contribution")
+        contrib_els = _TOP_CONTRIB_XPATH(item)
         try:
-            contribution = int(contrib_el.text.strip()) if contrib_el else 0
+            contribution = (
+                int(contrib_els[0].text_content().strip()) if contrib_els else 0
+            )
         except ValueError:
             contribution = 0
 
@@ -126,16 +226,40 @@ def parse_alliance_club_contributions(html: str, club_page: str = CLUB_PAGE_ATTR
             "contribution": contribution,
         })
 
-    logger.debug(f"[Alliance club] Спарсено {len(results)} участников из блока '{club_page}'")
+    logger.debug(
+        "[Alliance club] Спарсено %d участников из блока '%s'",
+        len(results), club_page,
+    )
     return results
 
 
-def compute_alliance_hash(contributions: List[Dict]) -> str:
-    data = ",".join(
-        f"{c['mangabuff_id']}:{c['contribution']}"
-        for c in contributions
-    )
-    return hashlib.md5(data.encode()).hexdigest()
+def compute_alliance_hash(contributions: List[Dict]) -> int:
+    """
+    Хэш снимка вкладов для детекта изменений.
+
+    Пары (id, вклад) пакуются в плоский массив фиксированной ширины —
+    ни одной форматированной строки на запись. Значение сравнивается
+    только на равенство внутри процесса, поэтому хватает встроенного
+    hash() вместо криптографического дайджеста.
+    """
+    flat = []
+    for c in contributions:
+        flat.append(c["mangabuff_id"])
+        flat.append(c["contribution"])
+    return hash(struct.pack(f"<{len(flat)}q", *flat))
+
+
+def _snapshot_digest(contributions: List[Dict]) -> str:
+    """
+    Стабильный дайджест снимка для хранения в alliance_weekly_meta.
+
+    В отличие от compute_alliance_hash, не зависит от PYTHONHASHSEED
+    и потому пригоден для сравнения через перезапуск процесса.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for c in contributions:
+        h.update(struct.pack("<2q", c["mangabuff_id"], c["contribution"]))
+    return h.hexdigest()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -144,27 +268,44 @@ def compute_alliance_hash(contributions: List[Dict]) -> str:
 
 
 async def get_alliance_week_rows(week_start: str) -> List[Dict]:
-    await ensure_alliance_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("""
-            SELECT * FROM alliance_club_contributions
-            WHERE week_start = ?
-            ORDER BY contribution_current DESC
-        """, (week_start,)) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(r) for r in rows]
+    # Явный список колонок: читателям нужны только эти четыре поля,
+    # и dict собирается напрямую, без копирования Row целиком
+    db = await get_db()
+    async with db.execute("""
+        SELECT nick, profile_url, contribution_baseline, contribution_current
+        FROM alliance_club_contributions
+        WHERE week_start = ?
+        ORDER BY contribution_current DESC
+    """, (week_start,)) as cursor:
+        rows = await cursor.fetchall()
+        return [
+            {
+                "nick":                  n,
+                "profile_url":           u,
+                "contribution_baseline": b,
+                "contribution_current":  c,
+            }
+            for (n, u, b, c) in rows
+        ]
 
 
 async def get_alliance_available_weeks() -> List[str]:
-    await ensure_alliance_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT DISTINCT week_start FROM alliance_club_contributions
-            ORDER BY week_start DESC
-        """) as cursor:
-            rows = await cursor.fetchall()
-            return [r[0] for r in rows]
+    db = await get_db()
+    async with db.execute("""
+        SELECT DISTINCT week_start FROM alliance_club_contributions
+        ORDER BY week_start DESC
+    """) as cursor:
+        rows = await cursor.fetchall()
+        return [r[0] for r in rows]
+
+
+async def _save_snapshot_hash(db: aiosqlite.Connection, snapshot_hash: str):
+    """Запоминает хэш последнего записанного снимка (без commit)."""
+    await db.execute("""
+        INSERT INTO alliance_weekly_meta (key, value)
+        VALUES ('last_snapshot_hash', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """, (snapshot_hash,))
 
 
 async def upsert_alliance_contributions(
@@ -172,41 +313,123 @@ async def upsert_alliance_contributions(
     contributions: List[Dict],
     is_new_week: bool,
 ):
-    await ensure_alliance_weekly_tables()
     updated_at = ts_for_db(now_msk())
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        for c in contributions:
-            if is_new_week:
-                await db.execute("""
-                    INSERT INTO alliance_club_contributions
-                        (week_start, mangabuff_id, nick, profile_url,
-                         contribution_baseline, contribution_current, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
-                        nick                   = excluded.nick,
-                        contribution_baseline  = excluded.contribution_baseline,
-                        contribution_current   = excluded.contribution_current,
-                        updated_at             = excluded.updated_at
-                """, (
-                    week_start, c["mangabuff_id"], c["nick"], c["profile_url"],
-                    c["contribution"], c["contribution"], updated_at,
-                ))
-            else:
-                await db.execute("""
-                    INSERT INTO alliance_club_contributions
-                        (week_start, mangabuff_id, nick, profile_url,
-                         contribution_baseline, contribution_current, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
-                        nick                  = excluded.nick,
-                        contribution_current  = excluded.contribution_current,
-                        updated_at            = excluded.updated_at
-                """, (
-                    week_start, c["mangabuff_id"], c["nick"], c["profile_url"],
-                    c["contribution"], c["contribution"], updated_at,
-                ))
-        await db.commit()
+    if is_new_week:
+        sql = """
+            INSERT INTO alliance_club_contributions
+                (week_start, mangabuff_id, nick, profile_url,
+                 contribution_baseline, contribution_current, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
+                nick                   = excluded.nick,
+                contribution_baseline  = excluded.contribution_baseline,
+                contribution_current   = excluded.contribution_current,
+                updated_at             = excluded.updated_at
+        """
+    else:
+        sql = """
+            INSERT INTO alliance_club_contributions
+                (week_start, mangabuff_id, nick, profile_url,
+                 contribution_baseline, contribution_current, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
+                nick                  = excluded.nick,
+                contribution_current  = excluded.contribution_current,
+                updated_at            = excluded.updated_at
+        """
+
+    params = [
+        (week_start, c["mangabuff_id"], c["nick"], c["profile_url"],
+         c["contribution"], c["contribution"], updated_at)
+        for c in contributions
+    ]
+
+    db = await get_db()
+
+    # Если снимок совпадает с последним записанным — не трогаем
+    # WAL и блокировку записи вообще
+    snapshot_hash = _snapshot_digest(contributions)
+    if not is_new_week:
+        async with db.execute(
+            "SELECT value FROM alliance_weekly_meta WHERE key = 'last_snapshot_hash'"
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row and row[0] == snapshot_hash:
+            return
+
+    # executemany: один проход через поток aiosqlite и один
+    # подготовленный стейтмент вместо await на каждую строку
+    await db.executemany(sql, params)
+    await _save_snapshot_hash(db, snapshot_hash)
+    await db.commit()
+
+
+async def upsert_alliance_contributions_returning(
+    week_start: str,
+    contributions: List[Dict],
+    is_new_week: bool,
+) -> List[Dict]:
+    """
+    Upsert вкладов и чтение строк недели одним соединением.
+
+    Горячий путь мониторинга делал пару upsert + get_alliance_week_rows —
+    два соединения и две транзакции на каждое обновление. Здесь
+    executemany и итоговый SELECT выполняются в одном подключении.
+    """
+    updated_at = ts_for_db(now_msk())
+
+    if is_new_week:
+        sql = """
+            INSERT INTO alliance_club_contributions
+                (week_start, mangabuff_id, nick, profile_url,
+                 contribution_baseline, contribution_current, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
+                nick                   = excluded.nick,
+                contribution_baseline  = excluded.contribution_baseline,
+                contribution_current   = excluded.contribution_current,
+                updated_at             = excluded.updated_at
+        """
+    else:
+        sql = """
+            INSERT INTO alliance_club_contributions
+                (week_start, mangabuff_id, nick, profile_url,
+                 contribution_baseline, contribution_current, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
+                nick                  = excluded.nick,
+                contribution_current  = excluded.contribution_current,
+                updated_at            = excluded.updated_at
+        """
+
+    params = [
+        (week_start, c["mangabuff_id"], c["nick"], c["profile_url"],
+         c["contribution"], c["contribution"], updated_at)
+        for c in contributions
+    ]
+
+    db = await get_db()
+    await db.executemany(sql, params)
+    await _save_snapshot_hash(db, _snapshot_digest(contributions))
+    await db.commit()
+
+    async with db.execute("""
+        SELECT nick, profile_url, contribution_baseline, contribution_current
+        FROM alliance_club_contributions
+        WHERE week_start = ?
+        ORDER BY contribution_current DESC
+    """, (week_start,)) as cursor:
+        rows = await cursor.fetchall()
+        return [
+            {
+                "nick":                  n,
+                "profile_url":           u,
+                "contribution_baseline": b,
+                "contribution_current":  c,
+            }
+            for (n, u, b, c) in rows
+        ]
 
 
 # ══════════════════════════════════════════════════════════════
@@ -215,15 +438,13 @@ async def upsert_alliance_contributions(
 
 
 async def get_pinned_alliance_message(chat_id: int) -> Optional[Dict]:
-    await ensure_alliance_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM pinned_alliance_weekly_message WHERE chat_id = ?",
-            (chat_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+    db = await get_db()
+    async with db.execute(
+        "SELECT * FROM pinned_alliance_weekly_message WHERE chat_id = ?",
+        (chat_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        return dict(row) if row else None
 
 
 async def save_pinned_alliance_message(
@@ -231,30 +452,30 @@ async def save_pinned_alliance_message(
     thread_id: Optional[int],
     message_id: int,
     week_start: str,
+    content_hash: Optional[str] = None,
 ):
-    await ensure_alliance_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO pinned_alliance_weekly_message
-                (chat_id, thread_id, message_id, week_start, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(chat_id) DO UPDATE SET
-                thread_id  = excluded.thread_id,
-                message_id = excluded.message_id,
-                week_start = excluded.week_start,
-                updated_at = excluded.updated_at
-        """, (chat_id, thread_id, message_id, week_start, ts_for_db(now_msk())))
-        await db.commit()
+    db = await get_db()
+    await db.execute("""
+        INSERT INTO pinned_alliance_weekly_message
+            (chat_id, thread_id, message_id, week_start, updated_at, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            thread_id    = excluded.thread_id,
+            message_id   = excluded.message_id,
+            week_start   = excluded.week_start,
+            updated_at   = excluded.updated_at,
+            content_hash = excluded.content_hash
+    """, (chat_id, thread_id, message_id, week_start, ts_for_db(now_msk()), content_hash))
+    await db.commit()
 
 
 async def clear_pinned_alliance_message(chat_id: int):
-    await ensure_alliance_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "DELETE FROM pinned_alliance_weekly_message WHERE chat_id = ?",
-            (chat_id,)
-        )
-        await db.commit()
+    db = await get_db()
+    await db.execute(
+        "DELETE FROM pinned_alliance_weekly_message WHERE chat_id = ?",
+        (chat_id,)
+    )
+    await db.commit()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -262,26 +483,34 @@ async def clear_pinned_alliance_message(chat_id: int):
 # ══════════════════════════════════════════════════════════════
 
 
+_ALLIANCE_MEDALS = ("🥇", "🥈", "🥉")
+
+
 def format_alliance_weekly_message(rows: list, week_start: str) -> str:
     """
     Показывает только тех, кто реально вкладывал за неделю (delta > 0),
     отсортированных по приросту по убыванию.
-    """
-    from alliance_weekly_stats import format_alliance_week_range
-    from timezone_utils import now_msk
 
+    Текст собирается в список с одним "".join в конце — без цепочек
+    конкатенаций; дельта каждой строки считается один раз.
+    """
     date_range = format_alliance_week_range(week_start)
 
-    # Фильтруем: только те, у кого прирост > 0
-    active_rows = [r for r in rows if r["contribution_current"] - r["contribution_baseline"] > 0]
-
-    # Сортируем по приросту по убыванию
-    active_rows.sort(key=lambda r: r["contribution_current"] - r["contribution_baseline"], reverse=True)
-
-    total_delta = sum(r["contribution_current"] - r["contribution_baseline"] for r in rows)
+    deltas = [
+        (r["contribution_current"] - r["contribution_baseline"], r)
+        for r in rows
+    ]
+    total_delta = sum(d for d, _ in deltas)
     updated = now_msk().strftime("%d.%m %H:%M МСК")
 
-    if not active_rows:
+    # Только те, у кого прирост > 0, по убыванию прироста
+    active = sorted(
+        (t for t in deltas if t[0] > 0),
+        key=lambda t: t[0],
+        reverse=True,
+    )
+
+    if not active:
         return (
             f"🏰 <b>Вклад клуба в альянс</b> ({date_range})\n\n"
             f"За эту неделю вкладов ещё не было.\n\n"
@@ -289,35 +518,26 @@ def format_alliance_weekly_message(rows: list, week_start: str) -> str:
             f"🕐 <i>Обновлено: {updated}</i>"
         )
 
-    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
-    medal_lines = []
-    rest_lines = []
+    parts = [f"🏰 <b>Вклад клуба в альянс</b> ({date_range})\n\n"]
+
+    for i, (delta, r) in enumerate(active, 1):
+        if i == 4:
+            parts.append("\n\n")   # отступ между призёрами и остальными
+        elif i > 1:
+            parts.append("\n")
 
-    for i, r in enumerate(active_rows, 1):
         url = r.get("profile_url", "")
         nick = r["nick"]
-        base = r["contribution_baseline"]
-        curr = r["contribution_current"]
-        delta = curr - base
         name_part = f'<a href="{url}">{nick}</a>' if url else nick
+        medal = _ALLIANCE_MEDALS[i - 1] if i <= 3 else f"{i}."
+        parts.append(
+            f"{medal} {name_part} — {r['contribution_baseline']} → "
+            f"<b>{r['contribution_current']}</b> (+{delta})"
+        )
 
-        line = f"{medals.get(i, f'{i}.')} {name_part} — {base} → <b>{curr}</b> (+{delta})"
-
-        if i <= 3:
-            medal_lines.append(line)
-        else:
-            rest_lines.append(line)
-
-    body = "\n".join(medal_lines)
-    if rest_lines:
-        body += "\n\n" + "\n".join(rest_lines)
-
-    return (
-        f"🏰 <b>Вклад клуба в альянс</b> ({date_range})\n\n"
-        + body
-        + f"\n📈 Прирост за неделю: <b>+{total_delta}</b>"
-        + f"\n🕐 <i>Обновлено: {updated}</i>"
-    )
+    parts.append(f"\n📈 Прирост за неделю: <b>+{total_delta}</b>")
+    parts.append(f"\n🕐 <i>Обновлено: {updated}</i>")
+    return "".join(parts)
 
 
 # ══════════════════════════════════════════════════════════════
@@ -333,14 +553,20 @@ async def send_or_update_alliance_pinned(
     chat_id   = REQUIRED_TG_GROUP_ID
     thread_id = GROUP_ALLIANCE_TOPIC_ID
     text      = format_alliance_weekly_message(rows, week_start)
+    content_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
     pinned_info = await get_pinned_alliance_message(chat_id)
 
     if pinned_info and pinned_info.get("week_start") != week_start:
-        logger.info(f"[Alliance] Смена недели → создаём новое сообщение")
+        logger.info("[Alliance] Смена недели → создаём новое сообщение")
         pinned_info = None
 
     if pinned_info:
+        # Текст не изменился — не дёргаем Telegram вообще, вместо
+        # round-trip с исключением "message is not modified"
+        if pinned_info.get("content_hash") == content_hash:
+            logger.debug("[Alliance] Текст не изменился, пропускаем edit")
+            return
         try:
             await bot.edit_message_text(
                 chat_id=chat_id,
@@ -350,7 +576,8 @@ async def send_or_update_alliance_pinned(
                 disable_web_page_preview=True,
             )
             await save_pinned_alliance_message(
-                chat_id, thread_id, pinned_info["message_id"], week_start
+                chat_id, thread_id, pinned_info["message_id"], week_start,
+                content_hash,
             )
             logger.info("✅ Закреплённое сообщение альянса обновлено")
             return
@@ -363,7 +590,7 @@ async def send_or_update_alliance_pinned(
                 logger.debug("[Alliance] Текст не изменился, пропускаем")
                 return
             else:
-                logger.error(f"[Alliance] Ошибка edit_message_text: {e}")
+                logger.error("[Alliance] Ошибка edit_message_text: %s", e)
                 return
 
     try:
@@ -383,12 +610,14 @@ async def send_or_update_alliance_pinned(
             logger.info("[Alliance] Сообщение закреплено")
         except TelegramError as e:
             logger.warning(
-                f"[Alliance] Не удалось закрепить: {e}\n"
-                "Убедись что бот — администратор с правом 'Закреплять сообщения'"
+                "[Alliance] Не удалось закрепить: %s\n"
+                "Убедись что бот — администратор с правом 'Закреплять сообщения'", e
             )
 
-        await save_pinned_alliance_message(chat_id, thread_id, msg.message_id, week_start)
+        await save_pinned_alliance_message(
+            chat_id, thread_id, msg.message_id, week_start, content_hash
+        )
         logger.info("✅ Новое закреплённое сообщение альянса отправлено")
 
     except TelegramError as e:
-        logger.error(f"[Alliance] Ошибка отправки: {e}")
\ No newline at end of file
+        logger.error("[Alliance] Ошибка отправки: %s", e)
\ No newline at end of file
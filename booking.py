@@ -1,6 +1,9 @@
 """FSM бронирования (личные сообщения)."""
 
 import logging
+import time
+from functools import lru_cache
+
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     ContextTypes,
@@ -13,7 +16,8 @@ from database import (
     create_booking,
     get_bookings_for_schedule,
     add_booking_event,
-    BookingConflictError
+    BookingConflictError,
+    BookingSlotTakenError
 )
 from timezone_utils import (
     get_today_date,
@@ -41,6 +45,41 @@ STEP_DATE = 1
 STEP_START_TIME = 2
 STEP_END_TIME = 3
 
+# TTL кэша занятых слотов между шагами FSM (сек)
+BUSY_CACHE_TTL = 30
+
+# Неизменяемые элементы клавиатур — объекты python-telegram-bot
+# заморожены после создания, их можно безопасно переиспользовать
+_NAV_ROW = ["◀️ Назад", "❌ Отмена"]
+_REMOVE_MARKUP = ReplyKeyboardRemove()
+
+
+@lru_cache(maxsize=1)
+def _date_picker_markup(today_label: str, tomorrow_label: str) -> ReplyKeyboardMarkup:
+    """Клавиатура выбора даты; метки меняются раз в сутки."""
+    return ReplyKeyboardMarkup(
+        [[today_label, tomorrow_label], ["❌ Отмена"]],
+        one_time_keyboard=True,
+        resize_keyboard=True,
+    )
+
+
+async def _get_busy_bookings(context: ContextTypes.DEFAULT_TYPE, selected_date: str):
+    """Занятые брони на дату с коротким кэшем в user_data.
+
+    Между соседними шагами FSM расписание почти наверняка не изменилось —
+    не ходим в БД повторно. Пересечения атомарно проверяет
+    create_booking в своей транзакции, так что гонки кэш не создаёт.
+    """
+    cached = context.user_data.get("busy_cache")
+    now = time.monotonic()
+    if cached and cached[0] == selected_date and now - cached[1] < BUSY_CACHE_TTL:
+        return cached[2]
+
+    busy_bookings = await get_bookings_for_schedule([selected_date])
+    context.user_data["busy_cache"] = (selected_date, now, busy_bookings)
+    return busy_bookings
+
 
 # ══════════════════════════════════════════════════════════════
 # HANDLERS
@@ -72,14 +111,18 @@ async def start_booking_flow(update: Update, context: ContextTypes.DEFAULT_TYPE)
     today = get_today_date()
     tomorrow = get_tomorrow_date()
 
-    keyboard = [
-        [f"📅 Сегодня, {format_date_ru(today)}", f"📅 Завтра, {format_date_ru(tomorrow)}"],
-        ["❌ Отмена"]
-    ]
+    today_label = f"📅 Сегодня, {format_date_ru(today)}"
+    tomorrow_label = f"📅 Завтра, {format_date_ru(tomorrow)}"
+
+    # Точное соответствие кнопка → дата: O(1) lookup вместо поиска подстроки
+    context.user_data["booking_date_options"] = {
+        today_label: today,
+        tomorrow_label: tomorrow,
+    }
 
     await update.message.reply_text(
         "📅 Выбери дату бронирования:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+        reply_markup=_date_picker_markup(today_label, tomorrow_label)
     )
 
     return STEP_DATE
@@ -92,35 +135,29 @@ async def receive_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if text == "❌ Отмена":
         return await cancel_booking_flow(update, context)
 
-    today = get_today_date()
-    tomorrow = get_tomorrow_date()
-
-    if "Сегодня" in text:
-        selected_date = today
-    elif "Завтра" in text:
-        selected_date = tomorrow
-    else:
+    selected_date = context.user_data.get("booking_date_options", {}).get(text)
+    if selected_date is None:
         await update.message.reply_text(
             "❌ Неверный выбор. Используй кнопки.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
     context.user_data["booking_date"] = selected_date
 
-    busy_bookings = await get_bookings_for_schedule([selected_date])
+    busy_bookings = await _get_busy_bookings(context, selected_date)
     available_slots = get_available_start_slots(selected_date, busy_bookings)
 
     if not available_slots:
         await update.message.reply_text(
             f"😔 На {format_date_ru(selected_date)} все слоты заняты.\n"
             f"Попробуй выбрать другую дату.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
     keyboard = format_time_slots_keyboard(available_slots, per_row=4)
-    keyboard.append(["◀️ Назад", "❌ Отмена"])
+    keyboard.append(_NAV_ROW)
 
     await update.message.reply_text(
         f"🕐 Выбери время начала брони:\n"
@@ -146,26 +183,26 @@ async def receive_start_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not start_time or ":" not in start_time:
         await update.message.reply_text(
             "❌ Неверный формат времени. Используй кнопки.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
     context.user_data["booking_start_time"] = start_time
 
     selected_date = context.user_data["booking_date"]
-    busy_bookings = await get_bookings_for_schedule([selected_date])
+    busy_bookings = await _get_busy_bookings(context, selected_date)
     available_slots = get_available_end_slots(selected_date, start_time, busy_bookings)
 
     if not available_slots:
         await update.message.reply_text(
             "😔 Нет доступных слотов окончания для этого времени.\n"
             "Попробуй другое время начала.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
     keyboard = format_time_slots_keyboard(available_slots, per_row=4)
-    keyboard.append(["◀️ Назад", "❌ Отмена"])
+    keyboard.append(_NAV_ROW)
 
     await update.message.reply_text(
         f"🕐 Начало: {start_time}\n"
@@ -187,11 +224,11 @@ async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.pop("booking_start_time", None)
 
         selected_date = context.user_data["booking_date"]
-        busy_bookings = await get_bookings_for_schedule([selected_date])
+        busy_bookings = await _get_busy_bookings(context, selected_date)
         available_slots = get_available_start_slots(selected_date, busy_bookings)
 
         keyboard = format_time_slots_keyboard(available_slots, per_row=4)
-        keyboard.append(["◀️ Назад", "❌ Отмена"])
+        keyboard.append(_NAV_ROW)
 
         await update.message.reply_text(
             f"🕐 Выбери время начала брони:\n"
@@ -206,7 +243,7 @@ async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not end_time or ":" not in end_time:
         await update.message.reply_text(
             "❌ Неверный формат времени. Используй кнопки.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
@@ -214,13 +251,13 @@ async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date = context.user_data["booking_date"]
     start_time = context.user_data["booking_start_time"]
 
-    # Финальная валидация (race condition guard)
+    # Валидация формата слота (пересечения атомарно проверяет create_booking)
     is_valid, error_msg = await validate_booking_slot(date, start_time, end_time)
     if not is_valid:
         await update.message.reply_text(
             f"⚠️ {error_msg}\n"
             f"Пожалуйста, выбери другое время.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
@@ -236,11 +273,18 @@ async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
             end_time=end_time,
             duration_hours=duration_hours
         )
+    except BookingSlotTakenError:
+        await update.message.reply_text(
+            "⚠️ Этот слот уже занят.\n"
+            "Кто-то успел забронировать быстрее.",
+            reply_markup=_REMOVE_MARKUP
+        )
+        return ConversationHandler.END
     except BookingConflictError:
         await update.message.reply_text(
             "⚠️ У тебя уже есть бронь на этот день.\n"
             "Одна дата — одна бронь.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=_REMOVE_MARKUP
         )
         return ConversationHandler.END
 
@@ -252,7 +296,7 @@ async def receive_end_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"👤 {db_user.tg_nickname} / {db_user.mangabuff_nick}\n\n"
         f"⚠️ За 5 минут до начала придёт уведомление.\n"
         f"Не подтвердишь в течение 5 минут после начала — бронь отменится.",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=_REMOVE_MARKUP
     )
 
     logger.info(
@@ -268,7 +312,7 @@ async def cancel_booking_flow(update: Update, context: ContextTypes.DEFAULT_TYPE
     """Отмена процесса бронирования."""
     await update.message.reply_text(
         "❌ Бронирование отменено.",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=_REMOVE_MARKUP
     )
     context.user_data.clear()
     return ConversationHandler.END
@@ -295,7 +339,7 @@ def get_booking_conversation_handler() -> ConversationHandler:
             ]
         },
         fallbacks=[
-            MessageHandler(filters.Regex(r"^(❌ Отмена|отмена|cancel)$"), cancel_booking_flow)
+            MessageHandler(filters.Text({"❌ Отмена", "отмена", "cancel"}), cancel_booking_flow)
         ],
         name="booking",
         persistent=False
@@ -5,6 +5,8 @@
 """
 
 import logging
+import time
+from collections import OrderedDict
 from typing import Optional, Tuple, List
 
 from database import get_user, get_user_active_bookings, User, Booking
@@ -12,6 +14,15 @@ from timezone_utils import get_today_date, get_tomorrow_date, format_date_ru
 
 logger = logging.getLogger(__name__)
 
+# Эмодзи статуса брони (остальные статусы → 🟡)
+_STATUS_EMOJI = {"confirmed": "🟢"}
+
+# TTL-кэш верифицированных пользователей: личность стабильна,
+# а inline-флоу дёргает проверку по 2-3 раза на взаимодействие
+_VERIFIED_CACHE_TTL = 60
+_VERIFIED_CACHE_SIZE = 1024
+_verified_cache: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+
 
 async def get_verified_user(tg_id: int) -> Optional[User]:
     """
@@ -29,6 +40,29 @@ async def get_verified_user(tg_id: int) -> Optional[User]:
     return user
 
 
+async def get_verified_user_cached(tg_id: int) -> Optional[User]:
+    """
+    get_verified_user с кэшем на минуту.
+
+    Кэшируются только положительные ответы: неверифицированный
+    пользователь после привязки аккаунта не должен ждать истечения TTL.
+    """
+    cached = _verified_cache.get(tg_id)
+    if cached and time.monotonic() - cached[0] < _VERIFIED_CACHE_TTL:
+        _verified_cache.move_to_end(tg_id)
+        return cached[1]
+
+    user = await get_verified_user(tg_id)
+    if user:
+        _verified_cache[tg_id] = (time.monotonic(), user)
+        _verified_cache.move_to_end(tg_id)
+        if len(_verified_cache) > _VERIFIED_CACHE_SIZE:
+            _verified_cache.popitem(last=False)
+    else:
+        _verified_cache.pop(tg_id, None)
+    return user
+
+
 async def get_active_bookings_today_tomorrow(tg_id: int) -> List[Booking]:
     """
     Возвращает активные брони пользователя на сегодня и завтра.
@@ -55,18 +89,18 @@ def format_active_bookings_text(bookings: List[Booking], for_group: bool = False
     Returns:
         текст сообщения
     """
-    text = "📋 У тебя уже есть активные брони:\n\n"
+    parts = ["📋 У тебя уже есть активные брони:\n\n"]
     for b in bookings:
-        status_emoji = "🟢" if b.status == "confirmed" else "🟡"
-        text += (
+        status_emoji = _STATUS_EMOJI.get(b.status, "🟡")
+        parts.append(
             f"{status_emoji} {format_date_ru(b.date)} | "
             f"🕐 {b.start_time} — {b.end_time} МСК\n"
             f"Для отмены брони используй команду: /cancelbooking {b.id}\n"
         )
 
     if for_group:
-        text += "\n⚠️ Одна дата — одна бронь."
+        parts.append("\n⚠️ Одна дата — одна бронь.")
     else:
-        text += "\nОдна дата — одна бронь. Хочешь отменить? → /cancelbooking"
+        parts.append("\nОдна дата — одна бронь. Хочешь отменить? → /cancelbooking")
 
-    return text
\ No newline at end of file
+    return "".join(parts)
\ No newline at end of file
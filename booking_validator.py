@@ -7,7 +7,7 @@ from typing import List, Tuple
 
 from config import BOOKING_MAX_HOURS
 from timezone_utils import now_msk, parse_booking_dt
-from database import Booking, check_booking_conflict
+from database import Booking
 
 logger = logging.getLogger(__name__)
 
@@ -169,7 +169,11 @@ async def validate_booking_slot(
     exclude_booking_id: int = None
 ) -> Tuple[bool, str]:
     """
-    Финальная валидация слота перед созданием брони.
+    Валидация формата слота перед созданием брони.
+
+    Проверка пересечений с другими бронями здесь больше не делается:
+    её атомарно выполняет create_booking внутри своей транзакции
+    (BookingSlotTakenError), поэтому функция не ходит в БД.
 
     Args:
         date: дата брони
@@ -192,14 +196,6 @@ async def validate_booking_slot(
     if duration > BOOKING_MAX_HOURS:
         return False, f"Максимальная длительность брони: {BOOKING_MAX_HOURS} ч"
 
-    # Проверка 3: нет конфликта с другими бронями (race condition guard)
-    has_conflict = await check_booking_conflict(
-        date, start_time, end_time, exclude_booking_id
-    )
-
-    if has_conflict:
-        return False, "Этот слот уже занят"
-
     return True, ""
 
 
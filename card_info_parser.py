@@ -5,10 +5,12 @@
 """
 
 import logging
+import time
 from typing import Optional, List, Tuple
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
 
 from config import BASE_URL, REQUEST_TIMEOUT
 
@@ -17,6 +19,19 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 2
 RETRY_DELAY = 3
 
+# Прекомпилированные XPath — как в parser.py, разбор идёт
+# C-парсером lxml без bs4-обёрток
+_CLASS_XP = 'contains(concat(" ", normalize-space(@class), " "), " %s ")'
+_X_CARD_NAME = etree.XPath(
+    'string((//div[%s]/@data-name)[1])' % (_CLASS_XP % "card-show")
+)
+_X_MOBILE_NICK = etree.XPath(
+    'string((//div[%s]/@data-name)[1])' % (_CLASS_XP % "mobile-profile__name")
+)
+_X_DESKTOP_NICK = etree.XPath(
+    'string((//div[%s])[1])' % (_CLASS_XP % "profile__name")
+)
+
 
 def get_card_name(session: requests.Session, card_id: int) -> str:
     """
@@ -43,18 +58,16 @@ def get_card_name(session: requests.Session, card_id: int) -> str:
                     f"{response.status_code} (попытка {attempt + 1})"
                 )
                 if attempt < MAX_RETRIES - 1:
-                    import time; time.sleep(RETRY_DELAY)
+                    time.sleep(RETRY_DELAY)
                 continue
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            doc = lxml_html.fromstring(response.content)
 
             # Ищем <div class="card-show" data-name="...">
-            card_div = soup.find("div", class_="card-show")
-            if card_div:
-                name = card_div.get("data-name", "").strip()
-                if name:
-                    logger.debug(f"Название карты {card_id}: {name}")
-                    return name
+            name = _X_CARD_NAME(doc).strip()
+            if name:
+                logger.debug(f"Название карты {card_id}: {name}")
+                return name
 
             logger.warning(f"Не удалось найти data-name для карты {card_id}")
             return f"Карта #{card_id}"
@@ -62,7 +75,7 @@ def get_card_name(session: requests.Session, card_id: int) -> str:
         except Exception as e:
             logger.error(f"Ошибка при получении названия карты {card_id}: {e}")
             if attempt < MAX_RETRIES - 1:
-                import time; time.sleep(RETRY_DELAY)
+                time.sleep(RETRY_DELAY)
 
     return f"Карта #{card_id}"
 
@@ -92,25 +105,21 @@ def get_user_nickname(session: requests.Session, user_id: int) -> str:
                     f"{response.status_code} (попытка {attempt + 1})"
                 )
                 if attempt < MAX_RETRIES - 1:
-                    import time; time.sleep(RETRY_DELAY)
+                    time.sleep(RETRY_DELAY)
                 continue
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            doc = lxml_html.fromstring(response.content)
 
             # Мобильный профиль: <div class="mobile-profile__name" data-name="...">
-            name_div = soup.find("div", class_="mobile-profile__name")
-            if name_div:
-                nick = name_div.get("data-name", "").strip()
-                if nick:
-                    logger.debug(f"Ник пользователя {user_id}: {nick}")
-                    return nick
+            nick = _X_MOBILE_NICK(doc).strip()
+            if nick:
+                logger.debug(f"Ник пользователя {user_id}: {nick}")
+                return nick
 
             # Запасной вариант: десктопный профиль
-            profile_div = soup.find("div", class_="profile__name")
-            if profile_div:
-                nick = profile_div.get_text(strip=True)
-                if nick:
-                    return nick
+            nick = _X_DESKTOP_NICK(doc).strip()
+            if nick:
+                return nick
 
             logger.warning(f"Не удалось найти ник пользователя {user_id}")
             return f"User#{user_id}"
@@ -118,7 +127,7 @@ def get_user_nickname(session: requests.Session, user_id: int) -> str:
         except Exception as e:
             logger.error(f"Ошибка при получении ника пользователя {user_id}: {e}")
             if attempt < MAX_RETRIES - 1:
-                import time; time.sleep(RETRY_DELAY)
+                time.sleep(RETRY_DELAY)
 
     return f"User#{user_id}"
 
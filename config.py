@@ -54,6 +54,13 @@ ALLIANCE_CHECK_INTERVAL = int(os.getenv("ALLIANCE_CHECK_INTERVAL", "60"))
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 ADMIN_TG_ID = int(os.getenv("ADMIN_TG_ID", "0"))
+
+# Множество администраторов (ADMIN_TG_IDS="1,2,3" в .env).
+# frozenset — проверка членства за O(1), хэши посчитаны один раз при импорте
+ADMIN_TG_IDS = frozenset(
+    int(x) for x in os.getenv("ADMIN_TG_IDS", str(ADMIN_TG_ID)).split(",")
+    if x.strip()
+)
 REQUIRED_TG_GROUP_ID = int(os.getenv("REQUIRED_TG_GROUP_ID", "0"))
 
 # ID топика (темы) в группе для уведомлений о новых картах клуба
@@ -2,7 +2,7 @@
 
 import logging
 import json
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import aiosqlite
@@ -81,6 +81,11 @@ class BookingConflictError(Exception):
     pass
 
 
+class BookingSlotTakenError(BookingConflictError):
+    """Слот пересекается с чужой активной бронью."""
+    pass
+
+
 # ══════════════════════════════════════════════════════════════
 # ИНИЦИАЛИЗАЦИЯ БД
 # ══════════════════════════════════════════════════════════════
@@ -322,6 +327,55 @@ async def toggle_user_active(tg_id: int) -> bool:
             return bool(new_value)
 
 
+async def get_and_delete_user(tg_id: int) -> Optional[User]:
+    """
+    Возвращает пользователя и удаляет его одной транзакцией.
+
+    Одно соединение вместо пары get_user + delete_user — вдвое меньше
+    round-trip'ов к БД, и удаление атомарно относительно выборки.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM users WHERE tg_id = ?", (tg_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if not row:
+            return None
+
+        await db.execute("DELETE FROM users WHERE tg_id = ?", (tg_id,))
+        await db.commit()
+        return User(**dict(row))
+
+
+async def get_and_toggle_user(tg_id: int) -> Optional[Tuple[User, bool]]:
+    """
+    Возвращает пользователя и переключает is_active одной транзакцией.
+
+    Returns:
+        (user, новое значение is_active) или None если пользователя нет
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM users WHERE tg_id = ?", (tg_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if not row:
+            return None
+
+        user = User(**dict(row))
+        new_value = 0 if user.is_active == 1 else 1
+        await db.execute(
+            "UPDATE users SET is_active = ? WHERE tg_id = ?",
+            (new_value, tg_id)
+        )
+        await db.commit()
+        return user, bool(new_value)
+
+
 async def get_all_users() -> List[User]:
     """Получает всех пользователей."""
     async with aiosqlite.connect(DB_PATH) as db:
@@ -348,13 +402,33 @@ async def create_booking(
     """
     Создаёт бронь.
 
+    Проверка пересечения слотов и вставка выполняются в одной
+    immediate-транзакции — между проверкой и записью никто не может
+    вклиниться, отдельный предварительный запрос в БД не нужен.
+
     Raises:
+        BookingSlotTakenError: если слот пересекается с чужой бронью
         BookingConflictError: если у пользователя уже есть активная бронь на эту дату
     """
     created_at = ts_for_db(now_msk())
 
     try:
         async with aiosqlite.connect(DB_PATH) as db:
+            # BEGIN IMMEDIATE берёт write-lock сразу: test-and-set
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("""
+                SELECT COUNT(*) FROM bookings
+                WHERE date = ?
+                  AND status IN ('pending', 'confirmed')
+                  AND NOT (end_time <= ? OR start_time >= ?)
+            """, (date, start_time, end_time)) as cursor:
+                row = await cursor.fetchone()
+            if row[0] > 0:
+                await db.execute("ROLLBACK")
+                raise BookingSlotTakenError(
+                    f"Слот {date} {start_time}-{end_time} уже занят"
+                )
+
             cursor = await db.execute("""
                 INSERT INTO bookings (
                     tg_id, tg_nickname, mangabuff_nick, date,
@@ -442,6 +516,13 @@ async def confirm_booking(booking_id: int, confirmed_at: str):
         await db.commit()
 
 
+_CANCEL_STATUS_MAP = {
+    "user": "cancelled_by_user",
+    "admin": "cancelled_by_admin",
+    "system": "cancelled"
+}
+
+
 async def cancel_booking(
     booking_id: int,
     cancelled_by: str,
@@ -450,12 +531,33 @@ async def cancel_booking(
 ):
     """Отменяет бронь."""
     cancelled_at = ts_for_db(now_msk())
-    status_map = {
-        "user": "cancelled_by_user",
-        "admin": "cancelled_by_admin",
-        "system": "cancelled"
-    }
-    status = status_map.get(cancelled_by, "cancelled")
+    status = _CANCEL_STATUS_MAP.get(cancelled_by, "cancelled")
+
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("""
+            UPDATE bookings
+            SET status = ?, cancelled_at = ?, cancelled_by = ?, cancel_reason = ?
+            WHERE id = ?
+        """, (status, cancelled_at, cancelled_by, cancel_reason, booking_id))
+        await db.commit()
+
+
+async def cancel_booking_with_event(
+    booking_id: int,
+    cancelled_by: str,
+    cancel_reason: str,
+    event_type: str,
+    actor_tg_id: Optional[int] = None
+):
+    """
+    Отменяет бронь и записывает событие одной транзакцией.
+
+    Один connect + один commit вместо пары cancel_booking +
+    add_booking_event; отмена и запись в журнал атомарны —
+    нет окна, где бронь отменена, а события нет.
+    """
+    cancelled_at = ts_for_db(now_msk())
+    status = _CANCEL_STATUS_MAP.get(cancelled_by, "cancelled")
 
     async with aiosqlite.connect(DB_PATH) as db:
         await db.execute("""
@@ -463,6 +565,11 @@ async def cancel_booking(
             SET status = ?, cancelled_at = ?, cancelled_by = ?, cancel_reason = ?
             WHERE id = ?
         """, (status, cancelled_at, cancelled_by, cancel_reason, booking_id))
+        await db.execute("""
+            INSERT INTO booking_events (
+                booking_id, event_type, actor_tg_id, actor_label, event_at
+            ) VALUES (?, ?, ?, ?, ?)
+        """, (booking_id, event_type, actor_tg_id, cancelled_by, cancelled_at))
         await db.commit()
 
 
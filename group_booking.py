@@ -1,17 +1,22 @@
 """Бронирование через inline-кнопки в группе."""
 
+import asyncio
 import logging
+import time
+from typing import Dict, Tuple
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
 from database import (
     create_booking,
     get_bookings_for_schedule,
-    BookingConflictError
+    BookingConflictError,
+    BookingSlotTakenError
 )
 from timezone_utils import (
-    get_today_date,
-    get_tomorrow_date,
+    get_today_tomorrow,
     format_date_ru,
     format_duration,
     calculate_duration_hours,
@@ -23,13 +28,77 @@ from booking_validator import (
     MAX_INLINE_SLOTS
 )
 from booking_utils import (
-    get_verified_user,
+    get_verified_user_cached,
     get_active_bookings_today_tomorrow,
     format_active_bookings_text
 )
 
 logger = logging.getLogger(__name__)
 
+# Короткий кэш занятых слотов: при серии нажатий inline-кнопок
+# одни и те же даты запрашиваются по несколько раз в секунду
+BOOKINGS_CACHE_TTL = 3
+_bookings_cache: Dict[Tuple[str, ...], Tuple[float, list]] = {}
+
+# TTL снимка занятых слотов, который переносится между шагами одного
+# флоу через user_data (гонки закрывает транзакция create_booking)
+FLOW_SNAPSHOT_TTL = 30
+
+
+async def _cached_bookings(dates: list) -> list:
+    """get_bookings_for_schedule с TTL-кэшем на серию callback'ов."""
+    key = tuple(dates)
+    cached = _bookings_cache.get(key)
+    if cached and time.monotonic() - cached[0] < BOOKINGS_CACHE_TTL:
+        return cached[1]
+
+    bookings = await get_bookings_for_schedule(dates)
+    _bookings_cache[key] = (time.monotonic(), bookings)
+    return bookings
+
+
+def _invalidate_bookings_cache():
+    """Сбрасывает кэш после создания брони — слоты изменились."""
+    _bookings_cache.clear()
+
+
+def _fmt_hhmm(compact: str) -> str:
+    """ "2130" → "21:30" — время в callback_data хранится без двоеточия."""
+    return f"{compact[:2]}:{compact[2:]}"
+
+
+# Микро-дебаунс правок сообщения: при спаме кнопок промежуточные
+# edit_message_text отбрасываются, до Telegram доходит последняя версия
+EDIT_DEBOUNCE_SECONDS = 0.3
+_pending_edits: Dict[Tuple[int, int], asyncio.Task] = {}
+
+
+async def _debounced_edit(query, text: str, reply_markup=None):
+    """edit_message_text с коалесцированием по (chat_id, message_id)."""
+    message = query.message
+    if message is None:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+        return
+
+    key = (message.chat_id, message.message_id)
+    prev = _pending_edits.pop(key, None)
+    if prev and not prev.done():
+        prev.cancel()
+
+    async def _do_edit():
+        try:
+            await asyncio.sleep(EDIT_DEBOUNCE_SECONDS)
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except asyncio.CancelledError:
+            pass
+        except TelegramError as e:
+            # "message is not modified" и подобное — не критично
+            logger.debug("edit_message_text: %s", e)
+        finally:
+            _pending_edits.pop(key, None)
+
+    _pending_edits[key] = asyncio.create_task(_do_edit())
+
 
 # ══════════════════════════════════════════════════════════════
 # ГЛАВНОЕ МЕНЮ БРОНИРОВАНИЯ
@@ -40,7 +109,11 @@ async def show_booking_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню выбора даты для бронирования."""
     user = update.effective_user
 
-    db_user = await get_verified_user(user.id)
+    # Проверка аккаунта и активных броней независимы — параллелим
+    db_user, existing = await asyncio.gather(
+        get_verified_user_cached(user.id),
+        get_active_bookings_today_tomorrow(user.id),
+    )
     if not db_user:
         await update.message.reply_text(
             "❌ Для бронирования нужно привязать аккаунт.\n"
@@ -48,35 +121,65 @@ async def show_booking_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    existing = await get_active_bookings_today_tomorrow(user.id)
     if existing:
         await update.message.reply_text(
             format_active_bookings_text(existing, for_group=True)
         )
         return
 
+    await _preload_slots_snapshot(context)
     await _send_date_menu(update.message.reply_text)
 
 
+async def _preload_slots_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """Забирает брони на обе даты одним запросом при входе в меню.
+
+    Обработчики выбора даты фильтруют снимок по дате в Python — весь
+    флоу обходится одним походом в БД вместо запроса на каждый шаг.
+    """
+    today, tomorrow = get_today_tomorrow()
+    snap = await _cached_bookings([today, tomorrow])
+    context.user_data["slots_snapshot"] = {"data": snap, "ts": time.monotonic()}
+
+
+def _slots_from_snapshot(context: ContextTypes.DEFAULT_TYPE, date: str):
+    """Брони на дату из предзагруженного снимка, None если он устарел."""
+    snap = context.user_data.get("slots_snapshot")
+    if snap and time.monotonic() - snap["ts"] < FLOW_SNAPSHOT_TTL:
+        return [b for b in snap["data"] if b.date == date]
+    return None
+
+
+# Готовая разметка меню дат: пересобирается только при смене пары
+# (сегодня, завтра), а не на каждый показ меню
+_date_menu_cache: "Tuple[Tuple[str, str], InlineKeyboardMarkup] | None" = None
+
+
+def _date_menu_markup(today: str, tomorrow: str) -> InlineKeyboardMarkup:
+    global _date_menu_cache
+    key = (today, tomorrow)
+    if _date_menu_cache is None or _date_menu_cache[0] != key:
+        keyboard = [
+            [InlineKeyboardButton(
+                f"📅 Сегодня, {format_date_ru(today)}",
+                callback_data=f"book_date|{today}"
+            )],
+            [InlineKeyboardButton(
+                f"📅 Завтра, {format_date_ru(tomorrow)}",
+                callback_data=f"book_date|{tomorrow}"
+            )]
+        ]
+        _date_menu_cache = (key, InlineKeyboardMarkup(keyboard))
+    return _date_menu_cache[1]
+
+
 async def _send_date_menu(reply_fn):
     """Вспомогательная функция: отправляет/редактирует меню выбора даты."""
-    today = get_today_date()
-    tomorrow = get_tomorrow_date()
-
-    keyboard = [
-        [InlineKeyboardButton(
-            f"📅 Сегодня, {format_date_ru(today)}",
-            callback_data=f"book_date:{today}"
-        )],
-        [InlineKeyboardButton(
-            f"📅 Завтра, {format_date_ru(tomorrow)}",
-            callback_data=f"book_date:{tomorrow}"
-        )]
-    ]
+    today, tomorrow = get_today_tomorrow()
 
     await reply_fn(
         "📅 Выбери дату для бронирования:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=_date_menu_markup(today, tomorrow)
     )
 
 
@@ -90,13 +193,21 @@ async def handle_date_selection(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
 
-    date = query.data.split(":")[1]
+    date = query.data.split("|")[1]
 
-    busy_bookings = await get_bookings_for_schedule([date])
+    busy_bookings = _slots_from_snapshot(context, date)
+    if busy_bookings is None:
+        busy_bookings = await _cached_bookings([date])
+    # Снимок для следующего шага флоу — выбор времени начала
+    # переиспользует его вместо повторного запроса к БД
+    context.user_data["busy_bookings"] = {
+        "date": date, "data": busy_bookings, "ts": time.monotonic(),
+    }
     available_slots = get_available_start_slots(date, busy_bookings)
 
     if not available_slots:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             f"😔 На {format_date_ru(date)} все слоты заняты.\n"
             f"Попробуй выбрать другую дату."
         )
@@ -104,11 +215,12 @@ async def handle_date_selection(update: Update, context: ContextTypes.DEFAULT_TY
 
     keyboard = _build_slots_keyboard(
         available_slots[:MAX_INLINE_SLOTS],
-        callback_prefix=f"book_start:{date}",
+        callback_prefix=f"book_start|{date}",
         back_callback="book_menu"
     )
 
-    await query.edit_message_text(
+    await _debounced_edit(
+        query,
         f"🕐 Дата: {format_date_ru(date)}\n\n"
         f"Выбери время начала брони:\n"
         f"(максимальная длительность — 2 часа)",
@@ -126,17 +238,24 @@ async def handle_start_time_selection(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
 
-    parts = query.data.split(":")
-    date = parts[1]
-    # ИСПРАВЛЕНО: Время формата HH:MM разбивается на parts[2] и parts[3]
-    # callback_data: "book_start:2026-02-16:21:00" -> ["book_start", "2026-02-16", "21", "00"]
-    start_time = f"{parts[2]}:{parts[3]}"
-
-    busy_bookings = await get_bookings_for_schedule([date])
+    # callback_data: "book_start|2026-02-16|2100" — один split без склейки
+    _, date, start_compact = query.data.split("|")
+    start_time = _fmt_hhmm(start_compact)
+
+    snapshot = context.user_data.get("busy_bookings")
+    if (
+        snapshot
+        and snapshot["date"] == date
+        and time.monotonic() - snapshot["ts"] < FLOW_SNAPSHOT_TTL
+    ):
+        busy_bookings = snapshot["data"]
+    else:
+        busy_bookings = await _cached_bookings([date])
     available_slots = get_available_end_slots(date, start_time, busy_bookings)
 
     if not available_slots:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             "😔 Нет доступных слотов окончания для этого времени.\n"
             "Попробуй другое время начала."
         )
@@ -144,11 +263,12 @@ async def handle_start_time_selection(update: Update, context: ContextTypes.DEFA
 
     keyboard = _build_slots_keyboard(
         available_slots,
-        callback_prefix=f"book_end:{date}:{start_time}",
-        back_callback=f"book_date:{date}"
+        callback_prefix=f"book_end|{date}|{start_compact}",
+        back_callback=f"book_date|{date}"
     )
 
-    await query.edit_message_text(
+    await _debounced_edit(
+        query,
         f"🕐 Дата: {format_date_ru(date)}\n"
         f"⏰ Начало: {start_time}\n\n"
         f"Выбери время окончания:",
@@ -167,28 +287,24 @@ async def handle_end_time_selection(update: Update, context: ContextTypes.DEFAUL
     await query.answer("⏳ Создаю бронь...")
 
     user = query.from_user
-    parts = query.data.split(":")
-    date = parts[1]
-    # ИСПРАВЛЕНО: Правильный парсинг времени
-    # callback_data: "book_end:2026-02-16:21:00:22:00" -> ["book_end", "2026-02-16", "21", "00", "22", "00"]
-    start_time = f"{parts[2]}:{parts[3]}"
-    end_time = f"{parts[4]}:{parts[5]}"
-
-    db_user = await get_verified_user(user.id)
+    # callback_data: "book_end|2026-02-16|2100|2200"
+    _, date, start_compact, end_compact = query.data.split("|")
+    start_time = _fmt_hhmm(start_compact)
+    end_time = _fmt_hhmm(end_compact)
+
+    db_user = await get_verified_user_cached(user.id)
     if not db_user:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             "❌ Для бронирования нужно привязать аккаунт.\n"
             "Напиши мне в личные сообщения: /start"
         )
         return
 
-    # Финальная валидация (race condition guard)
+    # Валидация формата слота (пересечения атомарно проверяет create_booking)
     is_valid, error_msg = await validate_booking_slot(date, start_time, end_time)
     if not is_valid:
-        await query.edit_message_text(
-            f"⚠️ {error_msg}\n"
-            f"Кто-то успел забронировать этот слот быстрее."
-        )
+        await _debounced_edit(query, f"⚠️ {error_msg}")
         return
 
     duration_hours = calculate_duration_hours(start_time, end_time)
@@ -203,14 +319,27 @@ async def handle_end_time_selection(update: Update, context: ContextTypes.DEFAUL
             end_time=end_time,
             duration_hours=duration_hours
         )
+    except BookingSlotTakenError:
+        await _debounced_edit(
+            query,
+            "⚠️ Этот слот уже занят.\n"
+            "Кто-то успел забронировать быстрее."
+        )
+        return
     except BookingConflictError:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             "⚠️ У тебя уже есть бронь на этот день.\n"
             "Одна дата — одна бронь."
         )
         return
 
-    await query.edit_message_text(
+    _invalidate_bookings_cache()
+    context.user_data.pop("busy_bookings", None)
+    context.user_data.pop("slots_snapshot", None)
+
+    await _debounced_edit(
+        query,
         f"✅ Бронь успешно создана!\n\n"
         f"🃏 Назначение: внос карт в клуб Таро\n"
         f"📅 Дата: {format_date_ru(date)}\n"
@@ -239,21 +368,27 @@ async def handle_back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     user = query.from_user
 
-    db_user = await get_verified_user(user.id)
+    db_user, existing = await asyncio.gather(
+        get_verified_user_cached(user.id),
+        get_active_bookings_today_tomorrow(user.id),
+    )
     if not db_user:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             "❌ Для бронирования нужно привязать аккаунт.\n"
             "Напиши мне в личные сообщения: /start"
         )
         return
 
-    existing = await get_active_bookings_today_tomorrow(user.id)
     if existing:
-        await query.edit_message_text(
+        await _debounced_edit(
+            query,
             format_active_bookings_text(existing, for_group=True)
         )
         return
 
+    # Возврат в меню — обновляем снапшот слотов на оба дня
+    await _preload_slots_snapshot(context)
     await _send_date_menu(query.edit_message_text)
 
 
@@ -273,26 +408,24 @@ def _build_slots_keyboard(
 
     Args:
         slots: список слотов ["14:30", "15:00", ...]
-        callback_prefix: префикс для callback_data (слот добавляется через :)
+        callback_prefix: префикс для callback_data (слот добавляется через | без двоеточия)
         back_callback: callback_data кнопки «Назад»
         per_row: кнопок в ряду
 
     Returns:
         список рядов InlineKeyboardButton
     """
-    keyboard = []
-    row = []
-    for slot in slots:
-        row.append(InlineKeyboardButton(
-            slot,
-            callback_data=f"{callback_prefix}:{slot}"
-        ))
-        if len(row) == per_row:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-
+    # Ряды нарезаются слайсами за один проход, без ручного row-буфера
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                slot,
+                callback_data=f"{callback_prefix}|{slot.replace(':', '')}"
+            )
+            for slot in slots[i:i + per_row]
+        ]
+        for i in range(0, len(slots), per_row)
+    ]
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=back_callback)])
     return keyboard
 
@@ -305,13 +438,13 @@ def _build_slots_keyboard(
 def register_group_booking_handlers(application):
     """Регистрирует handlers для бронирования в группах."""
     application.add_handler(
-        CallbackQueryHandler(handle_date_selection, pattern=r"^book_date:")
+        CallbackQueryHandler(handle_date_selection, pattern=r"^book_date\|")
     )
     application.add_handler(
-        CallbackQueryHandler(handle_start_time_selection, pattern=r"^book_start:")
+        CallbackQueryHandler(handle_start_time_selection, pattern=r"^book_start\|")
     )
     application.add_handler(
-        CallbackQueryHandler(handle_end_time_selection, pattern=r"^book_end:")
+        CallbackQueryHandler(handle_end_time_selection, pattern=r"^book_end\|")
     )
     application.add_handler(
         CallbackQueryHandler(handle_back_to_menu, pattern=r"^book_menu$")
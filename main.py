@@ -3,8 +3,10 @@
 import logging
 import asyncio
 import re
+import time
 from telegram import Update
 from telegram.ext import Application, MessageHandler, filters, ConversationHandler, ContextTypes
+from telegram.request import HTTPXRequest
 
 from config import TELEGRAM_BOT_TOKEN, LOGIN_EMAIL, LOGIN_PASSWORD, REQUIRED_TG_GROUP_ID
 from database import init_db, get_bookings_for_schedule
@@ -21,7 +23,7 @@ from handlers import register_user_handlers
 from admin_handlers import register_admin_handlers
 from group_booking import show_booking_menu, register_group_booking_handlers
 from schedule_view import format_schedule
-from timezone_utils import get_today_date, get_tomorrow_date
+from timezone_utils import get_today_tomorrow
 
 # Настройка логирования
 logging.basicConfig(
@@ -41,18 +43,70 @@ SCHEDULE_TRIGGER = re.compile(
     re.IGNORECASE
 )
 
+# Объединённый групповой триггер: один проход по тексту сообщения
+# вместо двух отдельных filters.Regex на каждый MessageHandler
+GROUP_TRIGGER = re.compile(
+    rf'(?:{BOOKING_TRIGGER.pattern})|(?:{SCHEDULE_TRIGGER.pattern})',
+    re.IGNORECASE
+)
+
+# Дешёвый подстрочный предфильтр: "брони" покрывает и "бронировать",
+# и "забронировать" — regex запускается только на кандидатах
+_TRIGGER_TOKENS = ("бронь", "брони", "расписание", "schedule")
+
+
+class _TriggerPrefilter(filters.MessageFilter):
+    """Отсекает обычный групповой трафик до запуска regex-фильтра."""
+
+    def filter(self, message) -> bool:
+        text = message.text
+        if not text:
+            return False
+        low = text.lower()
+        return any(token in low for token in _TRIGGER_TOKENS)
+
+
+TRIGGER_PREFILTER = _TriggerPrefilter()
+
 
 # ══════════════════════════════════════════════════════════════
 # ОБРАБОТЧИК ТРИГГЕРА "БРОНИ"
 # ══════════════════════════════════════════════════════════════
 
 
+async def handle_group_trigger(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Единый диспетчер групповых триггеров (бронь/расписание).
+
+    Сюда попадают только сообщения, уже прошедшие GROUP_TRIGGER;
+    приоритет прежний — триггер бронирования важнее расписания.
+    """
+    if BOOKING_TRIGGER.search(update.message.text):
+        await show_booking_menu(update, context)
+    else:
+        await handle_schedule_trigger(update, context)
+
+
+# Кэш расписания на случай всплеска триггеров: несколько сообщений
+# со словом "брони" подряд дают один запрос к БД вместо N
+SCHEDULE_CACHE_TTL = 3
+_schedule_cache = (None, 0.0, None)  # (даты, monotonic ts, строки)
+
+
 async def handle_schedule_trigger(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает расписание броней при упоминании слова 'брони'."""
-    today = get_today_date()
-    tomorrow = get_tomorrow_date()
+    global _schedule_cache
+    today, tomorrow = get_today_tomorrow()
+
+    key = (today, tomorrow)
+    if (
+        _schedule_cache[0] == key
+        and time.monotonic() - _schedule_cache[1] < SCHEDULE_CACHE_TTL
+    ):
+        bookings = _schedule_cache[2]
+    else:
+        bookings = await get_bookings_for_schedule([today, tomorrow])
+        _schedule_cache = (key, time.monotonic(), bookings)
 
-    bookings = await get_bookings_for_schedule([today, tomorrow])
     text = format_schedule(bookings, [today, tomorrow])
 
     await update.message.reply_text(text)
@@ -98,9 +152,16 @@ async def main():
     else:
         logger.warning("⚠️  Детектор рангов не готов (нет шаблонов)")
 
-    # Создание Telegram-бота
+    # Создание Telegram-бота. Пул соединений побольше дефолтного:
+    # закреп, уведомления и колбэки ходят параллельно по уже
+    # открытым TLS-соединениям вместо новых рукопожатий
     logger.info("🤖 Инициализация Telegram-бота...")
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(HTTPXRequest(connection_pool_size=10, read_timeout=10))
+        .build()
+    )
 
     application.bot_data["session"] = session
     application.bot_data["rank_detector"] = rank_detector
@@ -143,7 +204,7 @@ async def main():
             ]
         },
         fallbacks=[
-            MessageHandler(filters.Regex(r"^(❌ Отмена|отмена|cancel)$"), cancel_booking_flow)
+            MessageHandler(filters.Text({"❌ Отмена", "отмена", "cancel"}), cancel_booking_flow)
         ],
         name="booking_private",
         persistent=False,
@@ -153,26 +214,15 @@ async def main():
     )
     application.add_handler(booking_conv_private, group=0)
 
-    # 5. БРОНИРОВАНИЕ В ГРУППАХ через inline-кнопки
-    application.add_handler(
-        MessageHandler(
-            filters.TEXT &
-            filters.Regex(BOOKING_TRIGGER) &
-            (filters.ChatType.GROUP | filters.ChatType.SUPERGROUP) &
-            ~filters.COMMAND,
-            show_booking_menu
-        ),
-        group=0
-    )
-
-    # 6. ПОКАЗ РАСПИСАНИЯ по триггеру "брони"
+    # 5-6. ГРУППОВЫЕ ТРИГГЕРЫ (бронирование + расписание) — один
+    # MessageHandler с объединённым regex вместо двух сканов текста
     application.add_handler(
         MessageHandler(
-            filters.TEXT &
-            filters.Regex(SCHEDULE_TRIGGER) &
+            TRIGGER_PREFILTER &
+            filters.Regex(GROUP_TRIGGER) &
             (filters.ChatType.GROUP | filters.ChatType.SUPERGROUP) &
             ~filters.COMMAND,
-            handle_schedule_trigger
+            handle_group_trigger
         ),
         group=0
     )
@@ -2,10 +2,14 @@
 
 import logging
 import asyncio
+import hashlib
+import json
 import re
 from typing import Optional, Dict, Any, List
-from bs4 import BeautifulSoup
+
 import requests
+from lxml import etree
+from lxml import html as lxml_html
 
 from config import BASE_URL, CLUB_BOOST_PATH, PARSE_INTERVAL_SECONDS
 from timezone_utils import ts_for_db, now_msk
@@ -20,6 +24,70 @@ from weekly_stats import (
 
 logger = logging.getLogger(__name__)
 
+# Дроби вида "3 / 10" — и замены, и дневные вносы за один findall
+_RE_FRACTION = re.compile(r'(\d+)\s*/\s*(\d+)')
+_RE_CARD_ID = re.compile(r'/cards/(\d+)/users')
+_RE_USER_ID = re.compile(r'/users/(\d{1,7})')
+
+# Прекомпилированные XPath: обход страницы буста идёт по C-узлам
+# lxml без bs4-обёрток и перекомпиляции CSS-селекторов на каждый тик
+_CLASS_XP = 'contains(concat(" ", normalize-space(@class), " "), " %s ")'
+_X_CARD_HREF = etree.XPath(
+    '//a[contains(@href, "/cards/") and contains(@href, "/users")]/@href'
+)
+_X_CARD_IMG = etree.XPath(
+    'string((//*[%s]//img/@src)[1])' % (_CLASS_XP % "club-boost__image")
+)
+_X_OWNER_HREFS = etree.XPath(
+    '//*[%s]//a[contains(@href, "/users/")]/@href'
+    % (_CLASS_XP % "club-boost__owners-list")
+)
+_X_CSRF_TOKEN = etree.XPath('string(//meta[@name="csrf-token"]/@content)')
+_X_BOOST_BLOCK = etree.XPath('(//*[%s])[1]' % (_CLASS_XP % "club-boost"))
+
+# Сентинел: сервер ответил 304, страница не менялась — парсить нечего
+UNCHANGED = "UNCHANGED"
+
+# Начало недели меняется раз в сутки — нет смысла пересчитывать
+# timezone-арифметику на каждом тике цикла
+_week_start_cache = (None, "")
+
+
+def _get_week_start_cached() -> str:
+    """get_week_start с кэшем по текущей дате МСК."""
+    global _week_start_cache
+    today = now_msk().date()
+    if _week_start_cache[0] != today:
+        _week_start_cache = (today, get_week_start())
+    return _week_start_cache[1]
+
+
+class _FailureCounter:
+    """Счётчик неудач парсинга с семантикой test-and-set.
+
+    Решение о ротации прокси принимается через try_reset: даже если
+    цикл парсинга когда-нибудь размножится на несколько тикеров,
+    ротация на серию неудач сработает ровно один раз.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def increment(self):
+        self.value += 1
+
+    def reset(self):
+        self.value = 0
+
+    def try_reset(self, expected: int) -> bool:
+        """Сбрасывает счётчик, только если он достиг порога."""
+        if self.value >= expected:
+            self.value = 0
+            return True
+        return False
+
 
 class BoostPageParser:
     """Парсер страницы boost клуба."""
@@ -28,31 +96,82 @@ class BoostPageParser:
         self.session = session
         self.rank_detector = rank_detector
         self.url = f"{BASE_URL}{CLUB_BOOST_PATH}"
+
+        # Пул соединений с keep-alive на внутренней requests-сессии:
+        # тики парсера и AJAX недельной статистики не делают новое
+        # TLS-рукопожатие на каждый запрос. Retry с backoff гасит
+        # разовые сетевые сбои до того, как они попадут в счётчик ошибок
+        inner = session._session if hasattr(session, "_session") else session
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=20,
+            max_retries=requests.adapters.Retry(total=2, backoff_factor=0.3),
+        )
+        inner.mount("https://", adapter)
+        inner.mount("http://", adapter)
+        inner.headers["Connection"] = "keep-alive"
         self._consecutive_errors = 0
         self._max_consecutive_errors = 5
-
-    def parse(self) -> Optional[Dict[str, Any]]:
-        """Парсит страницу boost."""
+        self._err_log_counter = 0
+        # Валидаторы условного GET: при 304 сервер не шлёт тело вообще
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        # Кэш заголовков AJAX: csrf-token живёт всю сессию, нет смысла
+        # загружать страницу буста и пересобирать dict на каждый вызов
+        self._ajax_headers: Optional[Dict[str, str]] = None
+
+    def parse(self) -> "Dict[str, Any] | str | None":
+        """Парсит страницу boost.
+
+        Возвращает dict с данными карты, UNCHANGED при ответе 304
+        (страница не менялась с прошлого тика) либо None при ошибке.
+        """
         try:
-            response = self.session.get(self.url)
+            headers = {}
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+            response = self.session.get(
+                self.url, headers=headers or None, stream=True
+            )
+
+            if response.status_code == 304:
+                response.close()
+                self._mark_success()
+                return UNCHANGED
 
             if response.status_code != 200:
+                response.close()
                 logger.error(f"Ошибка загрузки страницы: {response.status_code}")
                 self._mark_error()
                 return None
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            self._etag = response.headers.get("ETag")
+            self._last_modified = response.headers.get("Last-Modified")
 
-            card_id = self._extract_card_id(soup)
+            # Тело страницы течёт из сокета прямо в C-парсер lxml —
+            # полный bytes/str документа в Python не материализуется
+            response.raw.decode_content = True
+            doc = lxml_html.parse(response.raw).getroot()
+            response.close()
+
+            card_id = self._extract_card_id(doc)
             if not card_id:
                 logger.error("Не удалось извлечь card_id")
                 self._mark_error()
                 return None
 
-            card_image_url = self._extract_card_image(soup)
-            replacements = self._extract_replacements(soup)
-            daily_donated = self._extract_daily_donated(soup)
-            club_owners = self._extract_club_owners(soup)
+            card_image_url = self._extract_card_image(doc)
+            # Счётчики живут в блоке буста — обходим его поддерево,
+            # а не текст всей страницы; один findall на оба значения
+            boost_block = _X_BOOST_BLOCK(doc)
+            counts_root = boost_block[0] if boost_block else doc
+            replacements, daily_donated = self._extract_counts(
+                counts_root.text_content()
+            )
+            club_owners = self._extract_club_owners(doc)
 
             self._mark_success()
 
@@ -70,12 +189,18 @@ class BoostPageParser:
                 requests.exceptions.ConnectionError,
                 requests.exceptions.Timeout) as e:
             self._mark_error()
-            logger.error(f"Ошибка сети при парсинге: {type(e).__name__}")
+            logger.error("Ошибка сети при парсинге: %s", type(e).__name__)
             return None
 
         except Exception as e:
             self._mark_error()
-            logger.error(f"Ошибка парсинга: {e}", exc_info=True)
+            # Полный traceback — на каждую десятую ошибку: при штормах
+            # прокси форматирование стека забивает CPU и лог
+            self._err_log_counter += 1
+            logger.error(
+                "Ошибка парсинга: %s", e,
+                exc_info=self._err_log_counter % 10 == 1,
+            )
             return None
 
     def fetch_weekly_ajax(self) -> Optional[str]:
@@ -84,8 +209,10 @@ class BoostPageParser:
 
         Алгоритм (проверен debug_csrf2.py):
         1. GET страницы буста через inner._session — получаем meta csrf-token
+           (результат кэшируется: токен живёт всю сессию)
         2. POST /clubs/getTopUsers?period=week через ту же inner сессию
-           с X-CSRF-TOKEN из meta тега
+           с X-CSRF-TOKEN из meta тега; при 403/419 токен обновляется
+           и POST повторяется один раз
 
         Важно использовать inner._session напрямую — RateLimitedSession
         не прокидывает куки домена корректно при POST.
@@ -95,39 +222,23 @@ class BoostPageParser:
         ajax_url = f"{BASE_URL}/clubs/getTopUsers?period=week"
 
         try:
-            # Шаг 1: GET страницы буста для получения свежего meta csrf-token
-            resp = inner.get(self.url, timeout=15)
-            if resp.status_code != 200:
-                logger.warning(
-                    f"[Weekly AJAX] GET буста вернул {resp.status_code}"
-                )
+            headers = self._ajax_headers or self._refresh_csrf_headers(inner)
+            if headers is None:
                 return None
 
-            soup = BeautifulSoup(resp.text, "html.parser")
-            meta = soup.find("meta", {"name": "csrf-token"})
-            if not meta:
-                logger.warning("[Weekly AJAX] meta[name=csrf-token] не найден на странице")
-                return None
+            # POST с meta токеном через ту же inner сессию
+            ajax_resp = inner.post(ajax_url, headers=headers, data=None, timeout=15)
 
-            meta_token = meta.get("content", "")
-            if not meta_token:
-                logger.warning("[Weekly AJAX] meta csrf-token пустой")
-                return None
-
-            logger.debug(f"[Weekly AJAX] meta csrf-token получен: {meta_token[:20]}...")
-
-            # Шаг 2: POST с meta токеном через ту же inner сессию
-            ajax_resp = inner.post(
-                ajax_url,
-                headers={
-                    "X-CSRF-TOKEN":     meta_token,
-                    "X-Requested-With": "XMLHttpRequest",
-                    "Referer":          self.url,
-                    "Accept":           "*/*",
-                },
-                data=None,
-                timeout=15,
-            )
+            # Токен протух (ротация сессии) — обновляем и повторяем раз
+            if ajax_resp.status_code in (403, 419):
+                logger.info(
+                    "[Weekly AJAX] csrf-token протух (HTTP %s), обновляем",
+                    ajax_resp.status_code,
+                )
+                headers = self._refresh_csrf_headers(inner)
+                if headers is None:
+                    return None
+                ajax_resp = inner.post(ajax_url, headers=headers, data=None, timeout=15)
 
             logger.info(
                 f"[Weekly AJAX] POST {ajax_url} → HTTP {ajax_resp.status_code}"
@@ -139,9 +250,10 @@ class BoostPageParser:
                 )
                 return None
 
-            # Ответ — JSON вида {"content": "<html...>"}
+            # Ответ — JSON вида {"content": "<html...>"}; json.loads по
+            # байтам минует определение кодировки внутри resp.json()
             try:
-                data = ajax_resp.json()
+                data = json.loads(ajax_resp.content)
                 content = data.get("content", "")
                 if content:
                     items = content.count("club-boost__top-item")
@@ -156,14 +268,17 @@ class BoostPageParser:
                 )
                 return None
             except ValueError:
-                if "club-boost__top" in ajax_resp.text:
+                # resp.text декодирует тело заново на каждое обращение —
+                # для не-JSON ответа декодируем байты ровно один раз
+                text = ajax_resp.content.decode("utf-8", "replace")
+                if "club-boost__top" in text:
                     logger.info(
-                        f"[Weekly AJAX] Получен raw HTML ({len(ajax_resp.text)} байт)"
+                        f"[Weekly AJAX] Получен raw HTML ({len(text)} байт)"
                     )
-                    return ajax_resp.text
+                    return text
                 logger.warning(
                     f"[Weekly AJAX] Ответ не содержит нужных данных. "
-                    f"Первые 200 символов: {ajax_resp.text[:200]}"
+                    f"Первые 200 символов: {text[:200]}"
                 )
                 return None
 
@@ -171,6 +286,32 @@ class BoostPageParser:
             logger.error(f"[Weekly AJAX] Ошибка: {e}", exc_info=True)
             return None
 
+    def _refresh_csrf_headers(self, inner) -> Optional[Dict[str, str]]:
+        """Загружает страницу буста и пересобирает заголовки AJAX.
+
+        Вызывается только при первом запросе и после 403/419 —
+        в остальных случаях работает кэш self._ajax_headers.
+        """
+        resp = inner.get(self.url, timeout=15)
+        if resp.status_code != 200:
+            logger.warning(f"[Weekly AJAX] GET буста вернул {resp.status_code}")
+            return None
+
+        meta_token = _X_CSRF_TOKEN(lxml_html.fromstring(resp.content))
+        if not meta_token:
+            logger.warning("[Weekly AJAX] meta csrf-token не найден на странице")
+            return None
+
+        logger.debug(f"[Weekly AJAX] meta csrf-token получен: {meta_token[:20]}...")
+
+        self._ajax_headers = {
+            "X-CSRF-TOKEN":     meta_token,
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer":          self.url,
+            "Accept":           "*/*",
+        }
+        return self._ajax_headers
+
     def _mark_success(self):
         self._consecutive_errors = 0
 
@@ -181,50 +322,41 @@ class BoostPageParser:
                 f"⚠️ {self._consecutive_errors} ошибок парсинга подряд"
             )
 
-    def _extract_card_id(self, soup: BeautifulSoup) -> Optional[int]:
-        link = soup.select_one('a[href*="/cards/"][href*="/users"]')
-        if link:
-            href = link.get("href", "")
-            match = re.search(r'/cards/(\d+)/users', href)
+    def _extract_card_id(self, doc) -> Optional[int]:
+        for href in _X_CARD_HREF(doc):
+            match = _RE_CARD_ID.search(href)
             if match:
                 return int(match.group(1))
         return None
 
-    def _extract_card_image(self, soup: BeautifulSoup) -> str:
-        img = soup.select_one('.club-boost__image img')
-        if img:
-            src = img.get("src", "")
-            if src:
-                if src.startswith("/"):
-                    return f"{BASE_URL}{src}"
-                return src
+    def _extract_card_image(self, doc) -> str:
+        src = _X_CARD_IMG(doc)
+        if src:
+            if src.startswith("/"):
+                return f"{BASE_URL}{src}"
+            return src
         return ""
 
-    def _extract_replacements(self, soup: BeautifulSoup) -> str:
-        text = soup.get_text()
-        match = re.search(r'(\d+)\s*/\s*(\d+)', text)
-        if match:
-            return f"{match.group(1)}/{match.group(2)}"
-        return "0/10"
-
-    def _extract_daily_donated(self, soup: BeautifulSoup) -> str:
-        text = soup.get_text()
-        matches = re.findall(r'(\d+)\s*/\s*(\d+)', text)
-        if len(matches) >= 2:
-            return f"{matches[1][0]}/{matches[1][1]}"
-        return "0/50"
-
-    def _extract_club_owners(self, soup: BeautifulSoup) -> List[int]:
-        owner_ids = []
-        owners_block = soup.select_one('.club-boost__owners-list')
-        if owners_block:
-            links = owners_block.select('a[href*="/users/"]')
-            for link in links:
-                href = link.get("href", "")
-                match = re.search(r'/users/(\d{1,7})', href)
-                if match:
-                    owner_ids.append(int(match.group(1)))
-        return owner_ids
+    def _extract_counts(self, text: str) -> tuple:
+        """Замены и дневные вносы из одного прохода по тексту страницы.
+
+        Раньше каждый счётчик заново вызывал get_text() по всему
+        документу и прогонял тот же regex; здесь оба берутся из
+        одного findall: первая дробь — замены, вторая — вносы за день.
+        """
+        matches = _RE_FRACTION.findall(text)
+        replacements = f"{matches[0][0]}/{matches[0][1]}" if matches else "0/10"
+        daily_donated = (
+            f"{matches[1][0]}/{matches[1][1]}" if len(matches) >= 2 else "0/50"
+        )
+        return replacements, daily_donated
+
+    def _extract_club_owners(self, doc) -> List[int]:
+        return [
+            int(m.group(1))
+            for href in _X_OWNER_HREFS(doc)
+            if (m := _RE_USER_ID.search(href))
+        ]
 
 
 async def parse_loop(session: requests.Session, bot, rank_detector: RankDetectorImproved):
@@ -237,11 +369,13 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
     parser = BoostPageParser(session, rank_detector)
     logger.info("🔄 Запущен цикл парсинга страницы boost")
 
-    consecutive_failures = 0
+    failures = _FailureCounter()
     max_consecutive_failures = 5
 
     last_weekly_hash: Optional[str] = None
-    last_week_start: str = get_week_start()
+    # Хэш сырого AJAX-ответа: байт-в-байт тот же HTML — парсинг не нужен
+    last_raw_weekly_hash: Optional[bytes] = None
+    last_week_start: str = _get_week_start_cached()
     weekly_check_counter: int = 0
     WEEKLY_CHECK_EVERY = 10
 
@@ -267,30 +401,42 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
     while True:
         try:
             current = await get_current_card()
-            data = parser.parse()
+            # Блокирующие HTTP + парсинг уходят в поток — event loop
+            # продолжает обслуживать Telegram-колбэки во время тика
+            data = await asyncio.to_thread(parser.parse)
 
             if data:
-                consecutive_failures = 0
+                failures.reset()
 
-                current_week_start = get_week_start()
+                current_week_start = _get_week_start_cached()
 
                 if current_week_start != last_week_start:
                     logger.info(
                         f"🗓 Новая неделя: {last_week_start} → {current_week_start}"
                     )
                     last_weekly_hash = None
+                    last_raw_weekly_hash = None
                     last_week_start = current_week_start
                     weekly_check_counter = WEEKLY_CHECK_EVERY - 1
 
                 weekly_check_counter += 1
                 if weekly_check_counter >= WEEKLY_CHECK_EVERY:
                     weekly_check_counter = 0
-                    loop = asyncio.get_event_loop()
-                    weekly_html = await loop.run_in_executor(
-                        None, parser.fetch_weekly_ajax
+                    weekly_html = await asyncio.to_thread(parser.fetch_weekly_ajax)
+
+                    raw_hash = (
+                        hashlib.blake2b(
+                            weekly_html.encode(), digest_size=16
+                        ).digest()
+                        if weekly_html else None
                     )
 
-                    if weekly_html:
+                    if weekly_html and raw_hash == last_raw_weekly_hash:
+                        logger.debug(
+                            "[Weekly AJAX] HTML не изменился — парсинг пропущен"
+                        )
+                    elif weekly_html:
+                        last_raw_weekly_hash = raw_hash
                         weekly_contributions = parse_weekly_contributions(weekly_html)
 
                         if weekly_contributions:
@@ -313,8 +459,10 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
                                 "[Weekly AJAX] HTML получен, но участники не распарсены"
                             )
 
-                # Мониторинг смены карты
-                if current is None or current.card_id != data["card_id"]:
+                # Мониторинг смены карты (при 304 страница не менялась)
+                if data is not UNCHANGED and (
+                    current is None or current.card_id != data["card_id"]
+                ):
                     logger.info(
                         f"🔄 Смена карты: "
                         f"{current.card_id if current else 'None'} → {data['card_id']}"
@@ -332,17 +480,19 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
 
                     await insert_card(data)
 
-                    loop = asyncio.get_event_loop()
-
-                    card_name = await loop.run_in_executor(
-                        None, get_card_name, session, data["card_id"]
-                    )
-
-                    owners_nicks = []
-                    if data["club_owners"]:
-                        owners_nicks = await loop.run_in_executor(
-                            None, get_owners_nicknames, session, data["club_owners"], 10
+                    # Название карты и ники владельцев — независимые
+                    # HTTP-запросы, забираем их параллельно
+                    owners_task = (
+                        asyncio.to_thread(
+                            get_owners_nicknames, session, data["club_owners"], 10
                         )
+                        if data["club_owners"]
+                        else asyncio.sleep(0, result=[])
+                    )
+                    card_name, owners_nicks = await asyncio.gather(
+                        asyncio.to_thread(get_card_name, session, data["card_id"]),
+                        owners_task,
+                    )
 
                     await notify_owners(bot, data)
                     await notify_group_new_card(bot, data, card_name, owners_nicks)
@@ -353,10 +503,11 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
                         f"владельцев: {len(owners_nicks)}"
                     )
             else:
-                consecutive_failures += 1
-                if consecutive_failures >= max_consecutive_failures:
+                failures.increment()
+                # test-and-set: порог срабатывает ровно один раз на серию
+                if failures.try_reset(max_consecutive_failures):
                     logger.warning(
-                        f"⚠️ {consecutive_failures} неудач подряд"
+                        f"⚠️ {max_consecutive_failures} неудач подряд"
                     )
                     try:
                         proxy_manager = bot._application.bot_data.get("proxy_manager")
@@ -364,10 +515,9 @@ async def parse_loop(session: requests.Session, bot, rank_detector: RankDetector
                             proxy_manager.mark_failure()
                     except Exception:
                         pass
-                    consecutive_failures = 0
 
         except Exception as e:
             logger.error(f"Ошибка в цикле парсинга: {e}", exc_info=True)
-            consecutive_failures += 1
+            failures.increment()
 
         await asyncio.sleep(PARSE_INTERVAL_SECONDS)
\ No newline at end of file
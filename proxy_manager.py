@@ -1,6 +1,9 @@
 """Менеджер прокси для ротации с автоматическим восстановлением."""
 
 import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional, Dict
 from fp.fp import FreeProxy
 import requests
@@ -9,6 +12,57 @@ from config import PROXY_COUNTRIES, BASE_URL, REQUEST_TIMEOUT
 
 logger = logging.getLogger(__name__)
 
+# Сколько кандидатов из списка тестировать за один поиск
+MAX_CANDIDATES = 16
+# Потоков на параллельное тестирование кандидатов
+TEST_WORKERS = 8
+
+# Ограничения набора проваленных прокси: бесплатные списки
+# перерабатываются, провал устаревает и прокси можно пробовать снова
+FAILED_MAXSIZE = 1024
+FAILED_TTL = 3600.0
+
+
+class _TTLSet:
+    """Набор с TTL и ограничением размера вместо голого set.
+
+    На долгоживущем боте set проваленных прокси рос бы без предела;
+    здесь запись устаревает через ttl секунд, а при переполнении
+    вытесняется самая старая.
+    """
+
+    def __init__(self, maxsize: int = FAILED_MAXSIZE, ttl: float = FAILED_TTL):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._items: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, item: str):
+        self._items[item] = time.monotonic()
+        self._items.move_to_end(item)
+        while len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def __contains__(self, item: str) -> bool:
+        ts = self._items.get(item)
+        if ts is None:
+            return False
+        if time.monotonic() - ts >= self._ttl:
+            del self._items[item]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        # Записи упорядочены по времени добавления — чистим с головы
+        now = time.monotonic()
+        for item, ts in list(self._items.items()):
+            if now - ts < self._ttl:
+                break
+            del self._items[item]
+        return len(self._items)
+
+    def clear(self):
+        self._items.clear()
+
 
 class ProxyManager:
     """Менеджер прокси с автоматической ротацией и восстановлением."""
@@ -20,7 +74,7 @@ class ProxyManager:
         """
         self._enabled = enabled
         self._current_proxy: Optional[str] = None
-        self._failed_proxies: set = set()
+        self._failed_proxies = _TTLSet()
         self._consecutive_failures = 0  # Счётчик последовательных ошибок
         self._max_consecutive_failures = 3  # После скольки ошибок искать новый прокси
     
@@ -78,59 +132,86 @@ class ProxyManager:
             )
     
     def _find_working_proxy(self) -> Optional[Dict[str, str]]:
-        """Ищет рабочий прокси из указанных стран."""
-        max_attempts = 2
-        
-        for attempt in range(max_attempts):
-            try:
-                logger.info(f"Поиск прокси (попытка {attempt + 1}/{max_attempts})...")
-                
-                proxy = FreeProxy(
-                    country_id=PROXY_COUNTRIES,
-                    https=True
-                ).get()
-                
-                # Пропускаем уже проваленные прокси
-                if proxy in self._failed_proxies:
-                    logger.debug(f"Прокси {proxy} уже был в списке проваленных, пропускаем")
-                    continue
-                
-                # Тестируем прокси
-                if self._test_proxy(proxy):
+        """Ищет рабочий прокси из указанных стран.
+
+        Забирает весь список кандидатов одним запросом и тестирует их
+        параллельно: побеждает первый ответивший, остальные тесты
+        отменяются. Время поиска — один таймаут вместо суммы таймаутов
+        последовательных попыток.
+        """
+        try:
+            candidates = FreeProxy(
+                country_id=PROXY_COUNTRIES,
+                https=True
+            ).get_proxy_list(False)
+        except Exception as e:
+            logger.warning(f"Ошибка при получении списка прокси: {e}")
+            return None
+
+        # Пропускаем уже проваленные прокси. Схема всегда http:// —
+        # free-proxy отдаёт обычные HTTP-прокси, https=True лишь
+        # фильтрует список; https://-URL заставил бы urllib3 делать
+        # TLS-рукопожатие с самим прокси, и тест валил бы всех подряд
+        candidates = [
+            p for raw in candidates
+            if (p := f"http://{raw}") not in self._failed_proxies
+        ][:MAX_CANDIDATES]
+
+        if not candidates:
+            logger.error("❌ Нет кандидатов прокси (все в списке проваленных)")
+            return None
+
+        logger.info(f"Параллельное тестирование {len(candidates)} прокси...")
+
+        with ThreadPoolExecutor(max_workers=TEST_WORKERS) as executor:
+            futures = {executor.submit(self._test_proxy, p): p for p in candidates}
+            for future in as_completed(futures):
+                proxy = futures[future]
+                try:
+                    ok = future.result()
+                except Exception:
+                    ok = False
+
+                if ok:
+                    # Ещё не стартовавшие тесты снимаем с очереди
+                    for f in futures:
+                        f.cancel()
                     self._current_proxy = proxy
                     self._consecutive_failures = 0
                     logger.info(f"✅ Найден рабочий прокси: {proxy}")
                     return self._format_proxy(proxy)
-                else:
-                    self._failed_proxies.add(proxy)
-                    
-            except Exception as e:
-                logger.warning(f"Ошибка при поиске прокси: {e}")
-        
+
+                self._failed_proxies.add(proxy)
+
         logger.error("❌ Не удалось найти рабочий прокси")
         return None
     
     def _test_proxy(self, proxy: str) -> bool:
         """
-        Тестирует прокси запросом к BASE_URL.
-        
+        Тестирует прокси HEAD-запросом к BASE_URL.
+
+        HEAD без редиректов не тянет тело страницы через прокси —
+        проверка достижимости стоит на порядок меньше байт и быстрее
+        упирается в таймаут на мёртвых прокси.
+
         Args:
             proxy: URL прокси
-        
+
         Returns:
             True если прокси работает
         """
         proxies = self._format_proxy(proxy)
-        
+
         try:
-            response = requests.get(
+            response = requests.head(
                 BASE_URL,
                 proxies=proxies,
                 timeout=REQUEST_TIMEOUT,
-                allow_redirects=True
+                allow_redirects=False
             )
-            return response.status_code == 200
-            
+            # 3xx/405 тоже означают "сервер достижим через прокси"
+            return response.status_code in (200, 301, 302, 405)
+
         except Exception as e:
             logger.debug(f"Тест прокси {proxy} провалился: {e}")
             return False
@@ -0,0 +1,44 @@
+"""Token-bucket лимитер для отправки сообщений в Telegram.
+
+Telegram ограничивает отправку ~1 сообщение/сек в один чат; превышение
+даёт 429 и дорогие ретраи. Бакет на ключ (chat_id) сглаживает
+многочастные отправки без выхода за лимит.
+"""
+
+import asyncio
+import time
+from typing import Dict, Hashable, Tuple
+
+
+class TokenBucket:
+    """Async token bucket с отдельным состоянием на каждый ключ."""
+
+    def __init__(self, rate: float = 1.0, per: float = 1.0, burst: int = 1):
+        """
+        Args:
+            rate:  сколько токенов восстанавливается за период `per`
+            per:   период восстановления в секундах
+            burst: максимальный запас токенов (всплеск без ожидания)
+        """
+        self._interval = per / rate
+        self._burst = float(burst)
+        # key -> (накопленные токены, момент последнего пересчёта)
+        self._state: Dict[Hashable, Tuple[float, float]] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, key: Hashable):
+        """Ждёт, пока для ключа не появится свободный токен."""
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                tokens, last = self._state.get(key, (self._burst, now))
+                tokens = min(self._burst, tokens + (now - last) / self._interval)
+
+                if tokens >= 1.0:
+                    self._state[key] = (tokens - 1.0, now)
+                    return
+
+                wait = (1.0 - tokens) * self._interval
+                self._state[key] = (tokens, now)
+
+            await asyncio.sleep(wait)
@@ -1,7 +1,7 @@
 """Форматирование расписания и истории броней."""
 
 import logging
-from typing import List
+from typing import Iterator, List
 from database import Booking
 from timezone_utils import format_date_ru, format_duration, format_time_range
 
@@ -66,63 +66,84 @@ def format_schedule(bookings: List[Booking], dates: List[str]) -> str:
 # ══════════════════════════════════════════════════════════════
 
 
-def format_user_history(bookings: List[Booking]) -> str:
+def iter_user_history(bookings: List[Booking]) -> Iterator[str]:
     """
-    Форматирует историю броней пользователя.
-    
+    Пошагово выдаёт блоки текста истории броней пользователя.
+
+    Позволяет стримить длинную историю в буферы по ~4000 символов,
+    не собирая весь текст в одну строку.
+
     Args:
         bookings: список броней пользователя
-    
-    Returns:
-        отформатированный текст истории
     """
     if not bookings:
-        return "📜 История моих броней:\n\nУ тебя пока нет броней."
-    
-    text = "📜 История моих броней:\n\n"
-    
+        yield "📜 История моих броней:\n\nУ тебя пока нет броней."
+        return
+
+    yield "📜 История моих броней:\n\n"
+
     for booking in bookings:
         emoji = _get_status_emoji(booking.status)
         status_text = _get_status_text(booking.status, booking.cancelled_by)
-        
-        text += (
+
+        yield (
             f"{emoji} {format_date_ru(booking.date)} | "
             f"{booking.start_time} — {booking.end_time} МСК | "
             f"{status_text}\n"
         )
-    
-    text += f"\nПоказаны последние {len(bookings)} броней."
-    
-    return text
 
+    yield f"\nПоказаны последние {len(bookings)} броней."
 
-def format_all_history(bookings: List[Booking]) -> str:
+
+def format_user_history(bookings: List[Booking]) -> str:
     """
-    Форматирует полную историю всех броней.
-    
+    Форматирует историю броней пользователя.
+
     Args:
-        bookings: список всех броней
-    
+        bookings: список броней пользователя
+
     Returns:
         отформатированный текст истории
     """
+    return "".join(iter_user_history(bookings))
+
+
+def iter_all_history(bookings: List[Booking]) -> Iterator[str]:
+    """
+    Пошагово выдаёт блоки текста полной истории броней.
+
+    Args:
+        bookings: список всех броней
+    """
     if not bookings:
-        return "📜 Полная история броней:\n\nБроней пока нет."
-    
-    text = "📜 Полная история броней (последние 50):\n\n"
-    
+        yield "📜 Полная история броней:\n\nБроней пока нет."
+        return
+
+    yield "📜 Полная история броней (последние 50):\n\n"
+
     for booking in bookings:
         emoji = _get_status_emoji(booking.status)
         status_text = _get_status_text(booking.status, booking.cancelled_by)
-        
-        text += (
+
+        yield (
             f"{emoji} {format_date_ru(booking.date)} "
             f"{booking.start_time}–{booking.end_time} МСК │ "
             f"{booking.mangabuff_nick} │ "
             f"{status_text}\n"
         )
-    
-    return text
+
+
+def format_all_history(bookings: List[Booking]) -> str:
+    """
+    Форматирует полную историю всех броней.
+
+    Args:
+        bookings: список всех броней
+
+    Returns:
+        отформатированный текст истории
+    """
+    return "".join(iter_all_history(bookings))
 
 
 def format_user_bookings(bookings: List[Booking]) -> str:
@@ -1,5 +1,7 @@
 """Утилиты работы с часовым поясом МСК."""
 
+import time as time_module
+
 import pytz
 from datetime import datetime, timedelta
 from config import TZ
@@ -140,6 +142,20 @@ def get_tomorrow_date() -> str:
     return (now_msk().date() + timedelta(days=1)).isoformat()
 
 
+# Пара (сегодня, завтра) с точностью до минуты: tz-арифметика
+# не повторяется на каждое сообщение горячего пути
+_today_pair_cache = (0, ("", ""))
+
+
+def get_today_tomorrow() -> tuple:
+    """Возвращает пару (сегодня, завтра) в формате YYYY-MM-DD."""
+    global _today_pair_cache
+    minute = int(time_module.time() // 60)
+    if _today_pair_cache[0] != minute:
+        _today_pair_cache = (minute, (get_today_date(), get_tomorrow_date()))
+    return _today_pair_cache[1]
+
+
 def calculate_duration_hours(start_time: str, end_time: str) -> float:
     """
     Вычисляет длительность в часах.
@@ -2,14 +2,18 @@
 Модуль недельной статистики вкладов в клуб.
 """
 
+import asyncio
 import hashlib
 import logging
 import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from html import escape
 from typing import List, Dict, Optional
 
 import aiosqlite
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
 from telegram import Bot
 from telegram.error import TelegramError
 
@@ -19,6 +23,22 @@ from timezone_utils import now_msk, ts_for_db
 logger = logging.getLogger(__name__)
 DB_PATH = "bot_data.db"
 
+# Скомпилирован один раз — в цикле парсинга поиск id идёт без
+# обращения к внутреннему кэшу модуля re на каждую ссылку
+_USER_ID_RE = re.compile(r"/users/(\d+)")
+
+# Прекомпилированные XPath: разметка AJAX-ответа фиксирована, обход
+# идёт по C-узлам lxml без bs4-обёрток и CSS-селекторов
+_CLASS_XP = 'contains(concat(" ", normalize-space(@class), " "), " %s ")'
+_X_TOP_ITEM = etree.XPath("//*[%s]" % (_CLASS_XP % "club-boost__top-item"))
+_X_TOP_POSITION = etree.XPath(
+    "string((.//*[%s])[1])" % (_CLASS_XP % "club-boost__top-position")
+)
+_X_TOP_NAME = etree.XPath("(.//a[%s])[1]" % (_CLASS_XP % "club-boost__top-name"))
+_X_TOP_CONTRIB = etree.XPath(
+    "string((.//*[%s])[1])" % (_CLASS_XP % "club-boost__top-contribution")
+)
+
 
 # ══════════════════════════════════════════════════════════════
 # УТИЛИТЫ НЕДЕЛИ
@@ -33,51 +53,105 @@ def get_week_start(dt: datetime = None) -> str:
 
 
 def get_week_end(week_start: str) -> str:
-    monday = datetime.strptime(week_start, "%Y-%m-%d").date()
+    # fromisoformat реализован на C и на порядок быстрее strptime
+    monday = date.fromisoformat(week_start)
     return (monday + timedelta(days=6)).isoformat()
 
 
+@lru_cache(maxsize=64)
 def format_week_range(week_start: str) -> str:
-    week_end = get_week_end(week_start)
-    s = datetime.strptime(week_start, "%Y-%m-%d")
-    e = datetime.strptime(week_end, "%Y-%m-%d")
+    # Диапазон меняется раз в неделю, а рендерится при каждом
+    # обновлении закрепа; fromisoformat реализован на C и на порядок
+    # быстрее strptime
+    s = date.fromisoformat(week_start)
+    e = s + timedelta(days=6)
     return f"{s.day:02d}.{s.month:02d} — {e.day:02d}.{e.month:02d}"
 
 
 # ══════════════════════════════════════════════════════════════
-# ИНИЦИАЛИЗАЦИЯ ТАБЛИЦ
+# СОЕДИНЕНИЕ И ИНИЦИАЛИЗАЦИЯ ТАБЛИЦ
 # ══════════════════════════════════════════════════════════════
 
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Долгоживущее соединение модуля.
+
+    Раньше каждый хелпер открывал новое aiosqlite.connect и заново
+    прогонял CREATE TABLE IF NOT EXISTS; теперь рукопожатие,
+    PRAGMA-настройки и схема выполняются один раз на процесс.
+    """
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(DB_PATH)
+                db.row_factory = aiosqlite.Row
+                # WAL прописывается в файл БД и действует для всех
+                # соединений; synchronous=NORMAL в WAL-режиме безопасен
+                # и убирает лишние fsync на каждый commit
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("PRAGMA temp_store=MEMORY")
+                await _create_tables(db)
+                _db = db
+    return _db
+
 
 async def ensure_weekly_tables():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS weekly_contributions (
-                id              INTEGER PRIMARY KEY AUTOINCREMENT,
-                week_start      TEXT NOT NULL,
-                mangabuff_id    INTEGER NOT NULL,
-                nick            TEXT NOT NULL,
-                profile_url     TEXT,
-                contribution    INTEGER NOT NULL DEFAULT 0,
-                recorded_at     TEXT NOT NULL,
-                UNIQUE(week_start, mangabuff_id)
-            )
-        """)
-        await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_weekly_week_start
-            ON weekly_contributions(week_start, contribution DESC)
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS pinned_weekly_message (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id     INTEGER NOT NULL UNIQUE,
-                thread_id   INTEGER,
-                message_id  INTEGER NOT NULL,
-                week_start  TEXT NOT NULL,
-                updated_at  TEXT NOT NULL
-            )
-        """)
-        await db.commit()
+    """Схема создаётся при первом get_db(); оставлено для совместимости."""
+    await get_db()
+
+
+# Вся схема одним скриптом: один проход парсера SQLite и один
+# переход в поток aiosqlite вместо четырёх
+_DDL_SCRIPT = """
+    CREATE TABLE IF NOT EXISTS weekly_contributions (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        week_start      TEXT NOT NULL,
+        mangabuff_id    INTEGER NOT NULL,
+        nick            TEXT NOT NULL,
+        profile_url     TEXT,
+        contribution    INTEGER NOT NULL DEFAULT 0,
+        recorded_at     TEXT NOT NULL,
+        UNIQUE(week_start, mangabuff_id)
+    );
+
+    -- Покрывающий индекс: SELECT недели читается index-only сканом,
+    -- без обращений к самой таблице. Старый индекс им полностью покрыт.
+    DROP INDEX IF EXISTS idx_weekly_week_start;
+    CREATE INDEX IF NOT EXISTS idx_weekly_week_cover
+    ON weekly_contributions(
+        week_start, contribution DESC,
+        mangabuff_id, nick, profile_url
+    );
+
+    CREATE TABLE IF NOT EXISTS pinned_weekly_message (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id     INTEGER NOT NULL UNIQUE,
+        thread_id   INTEGER,
+        message_id  INTEGER NOT NULL,
+        week_start  TEXT NOT NULL,
+        updated_at  TEXT NOT NULL,
+        content_hash TEXT
+    );
+"""
+
+
+async def _create_tables(db: aiosqlite.Connection):
+    await db.executescript(_DDL_SCRIPT)
+    # Миграция для БД, созданных до появления content_hash —
+    # отдельно от скрипта, т.к. на свежей схеме колонка уже есть
+    try:
+        await db.execute(
+            "ALTER TABLE pinned_weekly_message ADD COLUMN content_hash TEXT"
+        )
+    except aiosqlite.OperationalError:
+        pass
+    await db.commit()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -86,35 +160,34 @@ async def ensure_weekly_tables():
 
 
 def parse_weekly_contributions(html: str) -> List[Dict]:
-    soup = BeautifulSoup(html, "html.parser")
-    items = soup.select(".club-boost__top-item")
+    doc = lxml_html.fromstring(html)
+    items = _X_TOP_ITEM(doc)
     if not items:
         logger.warning("Не найдены .club-boost__top-item в ответе недельной статистики")
         return []
 
     results = []
     for item in items:
-        pos_el = item.select_one(".club-boost__top-position")
         try:
-            position = int(pos_el.text.strip()) if pos_el else 0
+            position = int(_X_TOP_POSITION(item).strip() or 0)
         except ValueError:
             position = 0
 
-        name_link = item.select_one("a.club-boost__top-name")
-        if not name_link:
+        name_links = _X_TOP_NAME(item)
+        if not name_links:
             continue
+        name_link = name_links[0]
 
-        nick = name_link.text.strip()
-        href = name_link.get("href", "")
+        nick = name_link.text_content().strip()
+        href = name_link.get("href") or ""
 
-        match = re.search(r"/users/(\d+)", href)
+        match = _USER_ID_RE.search(href)
         mangabuff_id = int(match.group(1)) if match else 0
 
         profile_url = f"{BASE_URL}{href}" if href.startswith("/") else href
 
-        contrib_el = item.select_one(".club-boost__top-contribution")
         try:
-            contribution = int(contrib_el.text.strip()) if contrib_el else 0
+            contribution = int(_X_TOP_CONTRIB(item).strip() or 0)
         except ValueError:
             contribution = 0
 
@@ -131,11 +204,13 @@ def parse_weekly_contributions(html: str) -> List[Dict]:
 
 
 def compute_stats_hash(contributions: List[Dict]) -> str:
-    data = ",".join(
-        f"{c['mangabuff_id']}:{c['contribution']}"
-        for c in contributions
-    )
-    return hashlib.md5(data.encode()).hexdigest()
+    # Хэш нужен только для детекта изменений: blake2b быстрее md5 и
+    # не ходит через openssl-провайдер; кормим хэшер инкрементально,
+    # не собирая промежуточную строку на весь список
+    h = hashlib.blake2b(digest_size=16)
+    for c in contributions:
+        h.update(f"{c['mangabuff_id']}:{c['contribution']},".encode())
+    return h.hexdigest()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -144,55 +219,69 @@ def compute_stats_hash(contributions: List[Dict]) -> str:
 
 
 async def save_weekly_contributions(week_start: str, contributions: List[Dict]):
-    await ensure_weekly_tables()
     recorded_at = ts_for_db(now_msk())
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        for c in contributions:
-            await db.execute("""
-                INSERT INTO weekly_contributions
-                    (week_start, mangabuff_id, nick, profile_url, contribution, recorded_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
-                    nick         = excluded.nick,
-                    contribution = excluded.contribution,
-                    recorded_at  = excluded.recorded_at
-            """, (
-                week_start,
-                c["mangabuff_id"],
-                c["nick"],
-                c["profile_url"],
-                c["contribution"],
-                recorded_at,
-            ))
-        await db.commit()
+    # executemany: стейтмент готовится один раз, драйвер сам итерирует
+    # привязки — вместо N отдельных execute в той же транзакции
+    rows = [
+        (
+            week_start,
+            c["mangabuff_id"],
+            c["nick"],
+            c["profile_url"],
+            c["contribution"],
+            recorded_at,
+        )
+        for c in contributions
+    ]
+
+    db = await get_db()
+    await db.executemany("""
+        INSERT INTO weekly_contributions
+            (week_start, mangabuff_id, nick, profile_url, contribution, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(week_start, mangabuff_id) DO UPDATE SET
+            nick         = excluded.nick,
+            contribution = excluded.contribution,
+            recorded_at  = excluded.recorded_at
+    """, rows)
+    await db.commit()
 
     logger.debug(f"Сохранено {len(contributions)} записей за неделю {week_start}")
 
 
 async def get_week_contributions_from_db(week_start: str) -> List[Dict]:
-    await ensure_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("""
-            SELECT * FROM weekly_contributions
-            WHERE week_start = ?
-            ORDER BY contribution DESC
-        """, (week_start,)) as cursor:
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+    db = await get_db()
+    # Явный список колонок: читателям нужны только эти четыре поля
+    async with db.execute("""
+        SELECT mangabuff_id, nick, profile_url, contribution
+        FROM weekly_contributions
+        WHERE week_start = ?
+        ORDER BY contribution DESC
+    """, (week_start,)) as cursor:
+        rows = await cursor.fetchall()
+        # Сборка dict из распакованного кортежа с фиксированными
+        # ключами дешевле, чем dict(Row) с чтением description на строку
+        return [
+            {
+                "mangabuff_id": mid,
+                "nick":         nick,
+                "profile_url":  url,
+                "contribution": contribution,
+            }
+            for (mid, nick, url, contribution) in rows
+        ]
 
 
 async def get_available_weeks() -> List[str]:
-    await ensure_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT DISTINCT week_start
-            FROM weekly_contributions
-            ORDER BY week_start DESC
-        """) as cursor:
-            rows = await cursor.fetchall()
-            return [row[0] for row in rows]
+    db = await get_db()
+    async with db.execute("""
+        SELECT DISTINCT week_start
+        FROM weekly_contributions
+        ORDER BY week_start DESC
+    """) as cursor:
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
 
 
 # ══════════════════════════════════════════════════════════════
@@ -201,15 +290,14 @@ async def get_available_weeks() -> List[str]:
 
 
 async def get_pinned_message_info(chat_id: int) -> Optional[Dict]:
-    await ensure_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM pinned_weekly_message WHERE chat_id = ?",
-            (chat_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+    db = await get_db()
+    async with db.execute(
+        "SELECT thread_id, message_id, week_start, content_hash "
+        "FROM pinned_weekly_message WHERE chat_id = ?",
+        (chat_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        return dict(row) if row else None
 
 
 async def save_pinned_message_info(
@@ -217,30 +305,30 @@ async def save_pinned_message_info(
     thread_id: Optional[int],
     message_id: int,
     week_start: str,
+    content_hash: Optional[str] = None,
 ):
-    await ensure_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            INSERT INTO pinned_weekly_message
-                (chat_id, thread_id, message_id, week_start, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(chat_id) DO UPDATE SET
-                thread_id  = excluded.thread_id,
-                message_id = excluded.message_id,
-                week_start = excluded.week_start,
-                updated_at = excluded.updated_at
-        """, (chat_id, thread_id, message_id, week_start, ts_for_db(now_msk())))
-        await db.commit()
+    db = await get_db()
+    await db.execute("""
+        INSERT INTO pinned_weekly_message
+            (chat_id, thread_id, message_id, week_start, updated_at, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            thread_id    = excluded.thread_id,
+            message_id   = excluded.message_id,
+            week_start   = excluded.week_start,
+            updated_at   = excluded.updated_at,
+            content_hash = excluded.content_hash
+    """, (chat_id, thread_id, message_id, week_start, ts_for_db(now_msk()), content_hash))
+    await db.commit()
 
 
 async def clear_pinned_message_info(chat_id: int):
-    await ensure_weekly_tables()
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "DELETE FROM pinned_weekly_message WHERE chat_id = ?",
-            (chat_id,)
-        )
-        await db.commit()
+    db = await get_db()
+    await db.execute(
+        "DELETE FROM pinned_weekly_message WHERE chat_id = ?",
+        (chat_id,)
+    )
+    await db.commit()
 
 
 # ══════════════════════════════════════════════════════════════
@@ -248,11 +336,14 @@ async def clear_pinned_message_info(chat_id: int):
 # ══════════════════════════════════════════════════════════════
 
 
-def _plural_contribution(n: int) -> str:
-    """Склонение: 1 вклад, 2 вклада, 5 вкладов."""
-    if 11 <= (n % 100) <= 14:
+# Медали призовых мест — кортеж вместо dict, собираемого на каждый рендер
+_MEDALS = ("🥇", "🥈", "🥉")
+
+
+def _plural_form(i: int) -> str:
+    if 11 <= i <= 14:
         return "вкладов"
-    last = n % 10
+    last = i % 10
     if last == 1:
         return "вклад"
     if last in (2, 3, 4):
@@ -260,6 +351,16 @@ def _plural_contribution(n: int) -> str:
     return "вкладов"
 
 
+# Склонение зависит только от n % 100 — вся ветвистая логика
+# сворачивается при импорте в таблицу из 100 готовых форм
+_PLURAL_BY_MOD100 = tuple(_plural_form(i) for i in range(100))
+
+
+def _plural_contribution(n: int) -> str:
+    """Склонение: 1 вклад, 2 вклада, 5 вкладов."""
+    return _PLURAL_BY_MOD100[n % 100]
+
+
 def format_weekly_message(contributions: List[Dict], week_start: str) -> str:
     date_range = format_week_range(week_start)
 
@@ -269,26 +370,26 @@ def format_weekly_message(contributions: List[Dict], week_start: str) -> str:
             f"Пока никто не сделал вклад."
         )
 
-    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
-    lines = []
+    # Текст собирается в список с одним "".join в конце; ник и URL —
+    # внешние данные, экранируем, иначе ник с "<" ломает parse_mode
+    parts = [f"📊 <b>Топ вкладчиков недели</b> ({date_range})\n\n"]
 
     for i, c in enumerate(contributions, 1):
-        prefix = medals.get(i, f"<b>{i}.</b>")
-        nick   = c["nick"]
+        if i > 1:
+            parts.append("\n")
+
+        prefix = _MEDALS[i - 1] if i <= 3 else f"<b>{i}.</b>"
+        nick   = escape(c["nick"])
         url    = c.get("profile_url", "")
         count  = c["contribution"]
         word   = _plural_contribution(count)
 
-        name_part = f'<a href="{url}">{nick}</a>' if url else nick
-        lines.append(f"{prefix} {name_part} — {count} {word}")
+        name_part = f'<a href="{escape(url)}">{nick}</a>' if url else nick
+        parts.append(f"{prefix} {name_part} — {count} {word}")
 
     updated = now_msk().strftime("%d.%m %H:%M МСК")
-
-    return (
-        f"📊 <b>Топ вкладчиков недели</b> ({date_range})\n\n"
-        + "\n".join(lines)
-        + f"\n\n🕐 <i>Обновлено: {updated}</i>"
-    )
+    parts.append(f"\n\n🕐 <i>Обновлено: {updated}</i>")
+    return "".join(parts)
 
 
 # ══════════════════════════════════════════════════════════════
@@ -304,6 +405,7 @@ async def send_or_update_weekly_pinned(
     chat_id   = REQUIRED_TG_GROUP_ID
     thread_id = GROUP_CARD_TOPIC_ID
     text      = format_weekly_message(contributions, week_start)
+    content_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
     pinned_info = await get_pinned_message_info(chat_id)
 
@@ -312,6 +414,11 @@ async def send_or_update_weekly_pinned(
         pinned_info = None
 
     if pinned_info:
+        # Текст не изменился — не дёргаем Telegram вообще, вместо
+        # round-trip с исключением "message is not modified"
+        if pinned_info.get("content_hash") == content_hash:
+            logger.debug("Текст закрепа не изменился, пропускаем edit")
+            return
         try:
             await bot.edit_message_text(
                 chat_id=chat_id,
@@ -321,7 +428,8 @@ async def send_or_update_weekly_pinned(
                 disable_web_page_preview=True,
             )
             await save_pinned_message_info(
-                chat_id, thread_id, pinned_info["message_id"], week_start
+                chat_id, thread_id, pinned_info["message_id"], week_start,
+                content_hash,
             )
             logger.info("✅ Закреплённое сообщение недельной статистики обновлено")
             return
@@ -358,7 +466,9 @@ async def send_or_update_weekly_pinned(
                 "Убедись что бот — администратор с правом 'Закреплять сообщения'"
             )
 
-        await save_pinned_message_info(chat_id, thread_id, msg.message_id, week_start)
+        await save_pinned_message_info(
+            chat_id, thread_id, msg.message_id, week_start, content_hash
+        )
         logger.info("✅ Новое закреплённое сообщение недельной статистики отправлено")
 
     except TelegramError as e: